@@ -0,0 +1,68 @@
+"""Query latency of the admin search index on a synthetic store
+
+Usage: python benchmarks/search_benchmark.py [orders] [runs]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import main
+
+NAMES = ["علی", "محمد", "زهرا", "فاطمه", "رضا", "مریم", "حسین", "سارا", "امیر", "نیلوفر"]
+FAMILIES = ["رضایی", "محمدی", "حسینی", "کریمی", "احمدی", "موسوی", "جعفری", "صادقی"]
+BUSINESSES = ["فروشگاهی", "شرکتی", "شخصی", "آموزشی", "خدماتی"]
+PURPOSES = ["فروش آنلاین", "معرفی خدمات", "نمونه کار", "وبلاگ"]
+FEATURES = ["گالری تصاویر", "درگاه پرداخت", "چند زبانه", "پنل مدیریت", "رزرو آنلاین", "چت آنلاین"]
+QUERIES = {
+    "exact name": "زهرا",
+    "arabic letters": "علي كريمي",
+    "partial name": "حسی",
+    "phone prefix": "۰۹۱۲۳",
+    "two terms": "فروشگاهی گالری",
+    "since": "since:2025-07-01 پرداخت",
+    "no match": "ناموجود",
+}
+
+
+def make_orders(count):
+    rng = random.Random(1)
+    # Spread the orders over 2025 so the since: query keeps about half of them
+    start = main.ORDER_ID_EPOCH + 366 * 86400
+    for i in range(count):
+        created = start + i * 365 * 86400 // count
+        yield {
+            "order_id": main.encode_order_id((created - main.ORDER_ID_EPOCH) << main.ORDER_ID_SEQ_BITS),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(created)),
+            "name": f"{rng.choice(NAMES)} {rng.choice(FAMILIES)}",
+            "phone": f"09{rng.randrange(10 ** 9):09d}",
+            "business": rng.choice(BUSINESSES),
+            "purpose": rng.choice(PURPOSES),
+            "features": "، ".join(rng.sample(FEATURES, 2)),
+            "extra": "",
+            "status": "pending",
+        }
+
+
+def main_benchmark(count, runs):
+    os.chdir(tempfile.mkdtemp())
+    main.write_orders(make_orders(count))
+    started = time.perf_counter()
+    main.load_search_index()
+    print(f"{count} orders, index built in {time.perf_counter() - started:.2f}s, {len(main.search_index)} tokens")
+    for label, query in QUERIES.items():
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            results = main.search_orders(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+        print(f"{label:15} {len(results):7} results  p50 {statistics.median(timings):8.2f} ms  p95 {p95:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000, int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -1,19 +1,158 @@
 import os
 import re
+import io
+import csv
+import hmac
+import fcntl
+import bisect
+import hashlib
+import html
+import secrets
+import shutil
+import signal
+import subprocess
+import sys
 import json
-from flask import Flask, request
+import mmap
+import heapq
+import itertools
+import codecs
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, Response, stream_with_context
 import requests
-import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from jdatetime import datetime as jdatetime
 
 app = Flask(__name__)
 TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")
-ORDER_FILE = "orders.txt"
-ORDERS_JSON = "orders.json"
+ADMIN_CHAT_IDS = [c.strip() for c in os.getenv("ADMIN_CHAT_IDS", ADMIN_CHAT_ID or "").split(",") if c.strip()]
+# Sharding: with SHARD_COUNT > 1 each process owns the chats hashed to SHARD_INDEX
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 1))
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", 0))
+SHARD_BASE_PORT = int(os.getenv("SHARD_BASE_PORT", 5101))
+SHARD_SECRET = os.getenv("SHARD_SECRET", "")
+SHARD_SUFFIX = f".shard{SHARD_INDEX}" if SHARD_COUNT > 1 else ""
+ORDER_FILE = f"orders{SHARD_SUFFIX}.txt"
+ORDERS_JSON = f"orders{SHARD_SUFFIX}.json"
+ATTACHMENTS_DIR = os.getenv("ATTACHMENTS_DIR", "attachments")
+ORDER_ID_SEQ_FILE = "order_id.seq"
+ANALYTICS_JSON = f"analytics{SHARD_SUFFIX}.json"
+TIMERS_JSON = f"timers{SHARD_SUFFIX}.json"
+TIMERS_JOURNAL = f"timers{SHARD_SUFFIX}.journal"
+BROADCAST_JSON = f"broadcast{SHARD_SUFFIX}.json"
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
 sessions = {}
 orders_db = {}
+store_lock = threading.RLock()
+
+# Order IDs: "ORD-" + 9 Crockford base32 chars of (seconds since epoch << 12 | sequence)
+ORDER_ID_EPOCH = 1704067200  # 2024-01-01 UTC
+ORDER_ID_SEQ_BITS = 12
+ORDER_ID_LENGTH = 9
+CROCKFORD_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+ORDER_ID_PATTERN = re.compile(r"^ORD-[0-9A-HJKMNP-TV-Z]{9}$")
+
+# Admin search: inverted index over order fields, built lazily and kept in sync on writes
+SEARCH_FIELDS = ["name", "phone", "business", "purpose", "features", "extra"]
+SEARCH_PAGE_SIZE = 5
+PERSIAN_NORMALIZE_TABLE = str.maketrans({
+    "ي": "ی", "ى": "ی", "ئ": "ی", "ك": "ک", "ة": "ه", "ۀ": "ه",
+    "أ": "ا", "إ": "ا", "آ": "ا", "\u200c": " ", "\u200d": "", "ـ": "",
+    **{d: str(i) for i, d in enumerate("۰۱۲۳۴۵۶۷۸۹")},
+    **{d: str(i) for i, d in enumerate("٠١٢٣٤٥٦٧٨٩")},
+})
+search_index = {}
+search_tokens = {}
+search_docs = {}
+search_time_ids = []
+search_legacy_ids = set()
+search_loaded = False
+# Guards the index structures above against concurrent request, attachment and scatter threads
+search_lock = threading.RLock()
+
+# Export/import: orders are streamed in chunks instead of loading the whole store
+EXPORT_FIELDS = [
+    "order_id", "date", "jalali_date", "name", "phone", "email", "telegram_username",
+    "business", "purpose", "features", "domain", "extra", "support", "chat_id",
+    "status", "status_text", "price", "attachments"
+]
+EXPORT_CHUNK_SIZE = 64 * 1024
+ORDER_STATUSES = ["pending", "priced", "completed", "rejected"]
+
+# Analytics: counters per business, purpose and Jalali week/month, updated on every write
+ANALYTICS_DIMENSIONS = ["business", "purpose", "week", "month"]
+
+# Scheduler: persisted timers kept in a heap and fired by a background thread
+PENDING_REMINDER_HOURS = float(os.getenv("PENDING_REMINDER_HOURS", 24))
+NUDGE_MINUTES = float(os.getenv("NUDGE_MINUTES", 60))
+NUDGE_SKIP_STEPS = ["completed", "track_order"]
+SCHEDULER_TICK = 1.0
+TIMERS_SAVE_INTERVAL = 5.0
+# Changes are appended to TIMERS_JOURNAL; the full table is rewritten only once the journal outgrows it
+TIMERS_COMPACT_MIN = 10000
+REMINDER_SEED_SPACING = 2.0
+timers = {}
+timer_heap = []
+timer_lock = threading.Lock()
+timer_changes = {}
+timers_generation = 0
+timers_journal_size = None  # entries in the current generation's journal; None until one exists
+scheduler_thread = None
+store_process_lock = None
+scheduler_metrics = {"fired": 0, "failed": 0, "lag": 0.0, "max_lag": 0.0}
+
+# Admin notifications: sent immediately up to a per-admin rate, then batched into digests
+# (queued orders live in the persisted digest timer's payload, so they survive restarts)
+NOTIFY_RATE_PER_MINUTE = float(os.getenv("NOTIFY_RATE_PER_MINUTE", 10))
+DIGEST_INTERVAL = float(os.getenv("DIGEST_INTERVAL", 60))
+DIGEST_MAX_ORDERS = 20
+# Buckets that have refilled to capacity are equivalent to absent ones and are swept out periodically
+RATE_BUCKET_SWEEP_INTERVAL = 60
+rate_buckets = {}
+rate_buckets_swept = time.time()
+rate_lock = threading.Lock()
+notify_lock = threading.Lock()
+
+# Broadcasts: one at a time, fanned out in a background thread with resumable progress
+BROADCAST_RATE_PER_SECOND = float(os.getenv("BROADCAST_RATE_PER_SECOND", 25))
+BROADCAST_SAVE_EVERY = 50
+broadcast_state = {}
+broadcast_thread = None
+broadcast_cancel = threading.Event()
+
+# Attachments: downloaded off the webhook thread in chunks and stored by content hash
+# (uploads wait in a per-chat pending dir until their order is saved, and are deleted if it never is)
+MAX_ATTACHMENT_BYTES = int(os.getenv("MAX_ATTACHMENT_BYTES", 20 * 1024 * 1024))
+MAX_ATTACHMENTS_PER_ORDER = int(os.getenv("MAX_ATTACHMENTS_PER_ORDER", 5))
+MAX_ATTACHMENTS_PER_DAY = int(os.getenv("MAX_ATTACHMENTS_PER_DAY", 20))
+ATTACHMENT_ABANDON_HOURS = float(os.getenv("ATTACHMENT_ABANDON_HOURS", 24))
+ATTACHMENTS_PENDING_DIR = os.path.join(ATTACHMENTS_DIR, f"pending{SHARD_SUFFIX}")
+ATTACHMENT_CHUNK_SIZE = 64 * 1024
+attachment_executor = ThreadPoolExecutor(max_workers=2)
+attachment_jobs = {}
+
+# Migration from legacy orders.txt / orders.json into the current store
+MIGRATE_CHECKPOINT = "migrate.checkpoint.json"
+MIGRATE_BATCH_SIZE = 1000
+TXT_ORDER_FIELDS = {
+    "OrderID": "order_id", "Date": "date", "Jalali Date": "jalali_date", "Name": "name",
+    "Phone": "phone", "Email": "email", "Telegram Username": "telegram_username",
+    "Business Type": "business", "Website Purpose": "purpose", "Features": "features",
+    "Has Domain/Host": "domain", "Extra Info": "extra", "Support": "support",
+    "Chat ID": "chat_id", "Status": "status"
+}
+
+# Every Bot API call gets a timeout so a hung connection can't stall a request or the broadcast thread
+TELEGRAM_TIMEOUT = 30
+
+SHARD_VNODES = 64
+SHARD_TIMEOUT = 10
+shard_executor = ThreadPoolExecutor(max_workers=max(2, SHARD_COUNT))
 
 def save_order(data, order_data=None):
     # Save to text file
@@ -22,26 +161,23 @@ def save_order(data, order_data=None):
     
     # Save to JSON for better management
     if order_data:
-        try:
-            with open(ORDERS_JSON, "r", encoding="utf-8") as f:
-                orders = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            orders = []
-        
-        orders.append(order_data)
-        with open(ORDERS_JSON, "w", encoding="utf-8") as f:
-            json.dump(orders, f, ensure_ascii=False, indent=2)
+        with store_lock:
+            # Raises on a damaged store rather than replacing it; append_orders creates a missing or empty one
+            append_orders([order_data])
+
+        refresh_index(order_data)
+        update_analytics(None, order_data)
+        schedule_timer(f"reminder:{order_data['order_id']}", PENDING_REMINDER_HOURS * 3600, "order_reminder", {"order_id": order_data['order_id']})
 
 def read_orders():
     try:
-        with open(ORDERS_JSON, "r", encoding="utf-8") as f:
-            orders = json.load(f)
+        orders, missing = recent_orders(10)
         
         if not orders:
-            return "هیچ سفارشی ثبت نشده است."
+            return "هیچ سفارشی ثبت نشده است." + format_missing_shards(missing)
         
         formatted_orders = "📋 **لیست سفارشات:**\n\n"
-        for order in orders[-10:]:  # Show last 10 orders
+        for order in orders:  # Show last 10 orders
             status_emoji = {
                 "pending": "⏳",
                 "priced": "💰", 
@@ -57,7 +193,7 @@ def read_orders():
 📅 {order['jalali_date']} | وضعیت: {order.get('status_text', 'در انتظار بررسی')}
 {'─' * 40}
 """
-        return formatted_orders
+        return formatted_orders + format_missing_shards(missing)
     except FileNotFoundError:
         return "هیچ سفارشی ثبت نشده است."
 
@@ -79,66 +215,1562 @@ def delete_order(order_id):
         pass
     
     # Delete from JSON
-    try:
-        with open(ORDERS_JSON, "r", encoding="utf-8") as f:
-            orders = json.load(f)
-        orders = [o for o in orders if o['order_id'] != order_id]
-        with open(ORDERS_JSON, "w", encoding="utf-8") as f:
-            json.dump(orders, f, ensure_ascii=False, indent=2)
-    except (FileNotFoundError, json.JSONDecodeError):
-        pass
+    removed = []
+
+    def remaining():
+        for order in iter_orders():
+            if order['order_id'] == order_id:
+                removed.append(order)
+            else:
+                yield order
+
+    with store_lock:
+        if os.path.exists(ORDERS_JSON):
+            write_orders(remaining())
+    for order in removed:
+        update_analytics(order, None)
+
+    unindex_order(order_id)
+    cancel_timer(f"reminder:{order_id}")
 
 def delete_old_orders():
     """Delete orders older than specified date"""
-    try:
-        with open(ORDERS_JSON, "r", encoding="utf-8") as f:
-            orders = json.load(f)
-        return orders
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+    return list(iter_orders())
 
 def get_order_stats():
+    """Get order statistics, summed over all shards in sharded mode"""
+    if SHARD_COUNT == 1:
+        return {**local_order_stats(), 'missing_shards': []}
+    stats = {'total': 0, 'today': 0, 'pending': 0, 'priced': 0, 'completed': 0, 'rejected': 0}
+    results = scatter("stats")
+    for shard_stats in results:
+        for key in stats:
+            stats[key] += (shard_stats or {}).get(key, 0)
+    stats['missing_shards'] = missing_shards(results)
+    return stats
+
+def local_order_stats():
     """Get order statistics"""
+    total = 0
+    today = jdatetime.now().strftime("%Y/%m/%d")
+    today_orders = 0
+    
+    status_count = {}
+    for order in iter_orders():
+        total += 1
+        if order.get('jalali_date', '').startswith(today):
+            today_orders += 1
+        status = order.get('status', 'pending')
+        status_count[status] = status_count.get(status, 0) + 1
+    
+    return {
+        'total': total,
+        'today': today_orders,
+        'pending': status_count.get('pending', 0),
+        'priced': status_count.get('priced', 0),
+        'completed': status_count.get('completed', 0),
+        'rejected': status_count.get('rejected', 0)
+    }
+
+def update_order_status(order_id, status, status_text, price=None):
+    """Update order status in JSON file"""
+    if price is None and status == "priced":
+        price = parse_price(status_text)
+    previous = None
+    updated = None
+
+    def rewritten():
+        nonlocal previous, updated
+        for order in iter_orders():
+            if order['order_id'] == order_id and updated is None:
+                previous = dict(order)
+                order['status'] = status
+                order['status_text'] = status_text
+                if price is not None:
+                    order['price'] = price
+                updated = order
+            yield order
+
+    with store_lock:
+        if not os.path.exists(ORDERS_JSON):
+            return
+        write_orders(rewritten())
+
+    if updated:
+        refresh_index(updated)
+        update_analytics(previous, updated)
+        if status != "pending":
+            cancel_timer(f"reminder:{order_id}")
+
+def encode_order_id(value):
+    chars = []
+    for _ in range(ORDER_ID_LENGTH):
+        chars.append(CROCKFORD_ALPHABET[value & 31])
+        value >>= 5
+    return "ORD-" + "".join(reversed(chars))
+
+def new_order_id():
+    """Generate a unique, time-sortable order ID, coordinated across processes by a locked sequence file"""
+    with open(ORDER_ID_SEQ_FILE, "a+", encoding="utf-8") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        try:
+            last_second, last_seq = map(int, f.read().split())
+        except ValueError:
+            last_second, last_seq = 0, -1
+        second = int(time.time()) - ORDER_ID_EPOCH
+        if second > last_second:
+            seq = 0
+        else:
+            # Same second (or clock went back): keep counting from the last issued ID
+            second, seq = last_second, last_seq + 1
+            if seq >> ORDER_ID_SEQ_BITS:
+                second, seq = second + 1, 0
+        f.seek(0)
+        f.truncate()
+        f.write(f"{second} {seq}")
+    return encode_order_id((second << ORDER_ID_SEQ_BITS) | seq)
+
+def order_id_floor(when):
+    """Smallest time-ordered ID that can be issued at or after `when` (a datetime)"""
+    second = max(0, int(when.timestamp()) - ORDER_ID_EPOCH)
+    return encode_order_id(second << ORDER_ID_SEQ_BITS)
+
+def normalize_order_id(text):
+    """Normalize user-typed IDs; legacy 8-hex-digit IDs pass through unchanged"""
+    order_id = text.strip().upper().translate(PERSIAN_NORMALIZE_TABLE)
+    if not order_id.startswith("ORD-"):
+        order_id = "ORD-" + order_id
+    code = order_id[4:]
+    if len(code) == ORDER_ID_LENGTH:
+        code = code.translate(str.maketrans("OIL", "011"))
+    return "ORD-" + code
+
+def is_time_ordered_id(order_id):
+    return bool(ORDER_ID_PATTERN.match(order_id))
+
+def parse_price(status_text):
+    """Extract the toman amount from a status text like 'قیمت اعلام شده: 1,500,000 تومان'"""
+    match = re.search(r"\d[\d,]*", str(status_text or "").translate(PERSIAN_NORMALIZE_TABLE))
+    if not match:
+        return None
+    return int(match.group().replace(",", ""))
+
+def jalali_week(jalali_date):
+    """Return the Saturday starting the Jalali week of a 'YYYY/MM/DD ...' date"""
+    day = jdatetime.strptime(jalali_date[:10], "%Y/%m/%d").date()
+    return (day - timedelta(days=day.weekday())).strftime("%Y/%m/%d")
+
+def order_rollup_keys(order):
+    jalali_date = order.get('jalali_date', '')
     try:
-        with open(ORDERS_JSON, "r", encoding="utf-8") as f:
-            orders = json.load(f)
-        
-        total = len(orders)
-        today = jdatetime.now().strftime("%Y/%m/%d")
-        today_orders = len([o for o in orders if o.get('jalali_date', '').startswith(today)])
-        
-        status_count = {}
-        for order in orders:
-            status = order.get('status', 'pending')
-            status_count[status] = status_count.get(status, 0) + 1
-        
+        week = jalali_week(jalali_date)
+    except ValueError:
+        week = "نامشخص"
+    return {
+        "business": order.get('business') or "نامشخص",
+        "purpose": order.get('purpose') or "نامشخص",
+        "week": week,
+        "month": jalali_date[:7] or "نامشخص"
+    }
+
+def apply_rollup(rollups, order, sign):
+    """Add (sign=1) or remove (sign=-1) one order's contribution to the rollups"""
+    status = order.get('status', 'pending')
+    price = order.get('price')
+    if price is None and status in ("priced", "completed"):
+        price = parse_price(order.get('status_text'))
+    for dimension, key in order_rollup_keys(order).items():
+        row = rollups.setdefault(dimension, {}).setdefault(key, {"orders": 0, "priced": 0, "rejected": 0, "price_sum": 0})
+        row["orders"] += sign
+        if status in ("priced", "completed"):
+            row["priced"] += sign
+        elif status == "rejected":
+            row["rejected"] += sign
+        if price:
+            row["price_sum"] += sign * price
+        if not row["orders"]:
+            del rollups[dimension][key]
+
+def save_analytics(rollups):
+    tmp_path = ANALYTICS_JSON + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(rollups, f, ensure_ascii=False)
+    os.replace(tmp_path, ANALYTICS_JSON)
+
+def rebuild_analytics():
+    """Recompute all rollups in one streaming pass over the order store (backfill)"""
+    rollups = {dimension: {} for dimension in ANALYTICS_DIMENSIONS}
+    with store_lock:
+        for order in iter_orders():
+            apply_rollup(rollups, order, 1)
+        save_analytics(rollups)
+    return rollups
+
+def load_analytics():
+    try:
+        with open(ANALYTICS_JSON, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def local_analytics():
+    rollups = load_analytics()
+    return rebuild_analytics() if rollups is None else rollups
+
+def get_analytics(rebuild=False):
+    """Rollups for every shard, rebuilding them from the stores first if `rebuild`"""
+    if SHARD_COUNT == 1:
+        return rebuild_analytics() if rebuild else local_analytics()
+    return merge_rollups(scatter("rebuild_analytics" if rebuild else "analytics"))
+
+def merge_rollups(results):
+    merged = {dimension: {} for dimension in ANALYTICS_DIMENSIONS}
+    for rollups in results:
+        for dimension, rows in (rollups or {}).items():
+            for key, row in rows.items():
+                total = merged.setdefault(dimension, {}).setdefault(key, dict.fromkeys(row, 0))
+                for field, value in row.items():
+                    total[field] = total.get(field, 0) + value
+    return merged
+
+def update_analytics(old_order, new_order):
+    """Move an order's contribution from its old state to its new state"""
+    # Serialized with the store writes so concurrent updates can't lose increments
+    with store_lock:
+        rollups = load_analytics()
+        if rollups is None:
+            # The rebuild reads the store, which already reflects this write
+            rebuild_analytics()
+            return
+        if old_order:
+            apply_rollup(rollups, old_order, -1)
+        if new_order:
+            apply_rollup(rollups, new_order, 1)
+        save_analytics(rollups)
+
+def format_analytics(rebuild=False):
+    rollups = get_analytics(rebuild)
+    titles = {
+        "business": "💼 بر اساس کسب‌وکار",
+        "purpose": "🎯 بر اساس هدف",
+        "month": "🗓 ماه‌های اخیر",
+        "week": "📆 هفته‌های اخیر"
+    }
+    text = "📈 <b>تحلیل سفارشات:</b>\n"
+    for dimension in ["business", "purpose", "month", "week"]:
+        rows = rollups.get(dimension, {})
+        if dimension in ("month", "week"):
+            keys = sorted(rows, reverse=True)[:6]
+        else:
+            keys = sorted(rows, key=lambda k: rows[k]["orders"], reverse=True)
+        if not keys:
+            continue
+        text += f"\n<b>{titles[dimension]}:</b>\n"
+        for key in keys:
+            row = rows[key]
+            rate = row["priced"] * 100 // row["orders"] if row["orders"] else 0
+            text += f"├ {key}: {row['orders']} سفارش | 💰 {row['priced']} ({rate}%) | ❌ {row['rejected']} | {row['price_sum']:,} تومان\n"
+    return text
+
+def normalize_persian(text):
+    """Normalize Arabic/Persian letter variants, ZWNJ and digits for searching"""
+    text = str(text or "").lower()
+    text = text.translate(PERSIAN_NORMALIZE_TABLE)
+    return re.sub(r"[^\w]+", " ", text).strip()
+
+def tokenize(text):
+    return [t for t in normalize_persian(text).split() if t]
+
+def index_order(order):
+    """Add or refresh a single order in the in-memory search index"""
+    with search_lock:
+        order_id = order['order_id']
+        unindex_order(order_id)
+        tokens = set()
+        for field in SEARCH_FIELDS:
+            tokens.update(tokenize(order.get(field, "")))
+        phone = normalize_persian(order.get('phone', "")).replace(" ", "")
+        if phone:
+            tokens.add(phone)
+        search_docs[order_id] = order
+        search_tokens[order_id] = tokens
+        if is_time_ordered_id(order_id):
+            bisect.insort(search_time_ids, order_id)
+        else:
+            search_legacy_ids.add(order_id)
+        for token in tokens:
+            search_index.setdefault(token, set()).add(order_id)
+
+def unindex_order(order_id):
+    with search_lock:
+        for token in search_tokens.pop(order_id, ()):
+            ids = search_index.get(token)
+            if ids:
+                ids.discard(order_id)
+                if not ids:
+                    del search_index[token]
+        if search_docs.pop(order_id, None) is None:
+            return
+        if is_time_ordered_id(order_id):
+            i = bisect.bisect_left(search_time_ids, order_id)
+            if i < len(search_time_ids) and search_time_ids[i] == order_id:
+                del search_time_ids[i]
+        else:
+            search_legacy_ids.discard(order_id)
+
+def refresh_index(order):
+    """Index a written order if the index has been built (a build in progress picks it up or waits)"""
+    with search_lock:
+        if search_loaded:
+            index_order(order)
+
+def load_search_index():
+    """Build the search index once from the JSON store; later writes update it incrementally"""
+    global search_loaded
+    with search_lock:
+        if search_loaded:
+            return
+        for order in iter_orders():
+            index_order(order)
+        search_loaded = True
+
+def orders_since(since):
+    """IDs of orders created at or after the ISO datetime `since`, via a range scan on time-ordered IDs"""
+    with search_lock:
+        load_search_index()
+        start = bisect.bisect_left(search_time_ids, order_id_floor(datetime.fromisoformat(since)))
+        order_ids = search_time_ids[start:]
+        # Legacy random IDs carry no time, so fall back to their stored date
+        order_ids += [oid for oid in search_legacy_ids if search_docs[oid].get('date', '') >= since]
+        return order_ids
+
+def search_orders(query):
+    """Return orders matching every query token across all shards, best matches and newest first"""
+    if SHARD_COUNT == 1:
+        return [order for _, order in rank_orders(query)]
+    ranked = [tuple(item) for result in scatter("search", {"query": query}) for item in result or []]
+    ranked.sort(key=lambda item: (item[0], item[1].get('date', '')), reverse=True)
+    return [order for _, order in ranked]
+
+def rank_orders(query):
+    """(score, order) pairs from this shard matching every query token, best matches and newest first
+
+    A 'since:DATE' (or 'از:DATE') term limits results to orders created on or after DATE.
+    """
+    with search_lock:
+        load_search_index()
+        since_ids = None
+        match = re.search(r"(?:^|\s)(?:since|از):(\S+)", query)
+        if match:
+            try:
+                since_ids = set(orders_since(parse_date_filter(match.group(1))))
+            except ValueError:
+                return []
+            query = query.replace(match.group(0), " ")
+        terms = tokenize(query)
+        if not terms:
+            if since_ids is None:
+                return []
+            ranked = sorted(since_ids, key=lambda oid: search_docs[oid].get('date', ''), reverse=True)
+            return [(0, search_docs[oid]) for oid in ranked]
+        scores = None
+        for term in terms:
+            term_scores = {}
+            for order_id in search_index.get(term, ()):
+                term_scores[order_id] = 2
+            # Partial matches (part of a name or phone number)
+            for token, ids in search_index.items():
+                if term != token and term in token:
+                    for order_id in ids:
+                        term_scores.setdefault(order_id, 1)
+            if since_ids is not None:
+                term_scores = {oid: s for oid, s in term_scores.items() if oid in since_ids}
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {oid: s + term_scores[oid] for oid, s in scores.items() if oid in term_scores}
+            if not scores:
+                return []
+        ranked = sorted(scores, key=lambda oid: (scores[oid], search_docs[oid].get('date', '')), reverse=True)
+        return [(scores[oid], search_docs[oid]) for oid in ranked]
+
+def format_search_results(query, page=0):
+    results = search_orders(query)
+    if not results:
+        return "🔎 <b>نتیجه‌ای یافت نشد!</b>", None
+
+    pages = (len(results) + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+    page = max(0, min(page, pages - 1))
+    status_emoji = {
+        "pending": "⏳",
+        "priced": "💰",
+        "completed": "✅",
+        "rejected": "❌"
+    }
+    text = f"🔎 <b>نتایج جستجو برای «{html.escape(query)}»:</b> {len(results)} مورد (صفحه {page + 1} از {pages})\n"
+    for order in results[page * SEARCH_PAGE_SIZE:(page + 1) * SEARCH_PAGE_SIZE]:
+        emoji = status_emoji.get(order.get("status", "pending"), "⏳")
+        text += f"""
+{emoji} <b>سفارش</b> <code>{html.escape(str(order['order_id']))}</code>
+👤 {html.escape(str(order.get('name', '')))} | 📱 {html.escape(str(order.get('phone', '')))}
+💼 {html.escape(str(order.get('business', '')))} | 🎯 {html.escape(str(order.get('purpose', '')))}
+📅 {html.escape(str(order.get('jalali_date', '')))} | وضعیت: {html.escape(str(order.get('status_text', 'در انتظار بررسی')))}
+{'─' * 20}
+"""
+
+    nav = []
+    if page > 0:
+        nav.append({"text": "⬅️ قبلی", "callback": f"search_page_{page - 1}"})
+    if page < pages - 1:
+        nav.append({"text": "بعدی ➡️", "callback": f"search_page_{page + 1}"})
+    keyboard = create_glass_keyboard([nav]) if nav else None
+    return text, keyboard
+
+def iter_json_array(path, offset=0):
+    """Incrementally parse a JSON array file, yielding (item, byte offset after item)
+
+    Raises ValueError on a malformed entry or a missing closing ']' so rewrites of a damaged
+    store abort instead of dropping everything after the damage. An empty file is an empty array.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        f.seek(offset)
+        buf = ""
+        pos = offset
+        eof = False
+        started = offset > 0
+        while True:
+            i = 0
+            while i < len(buf) and buf[i] in " \t\r\n,[":
+                started = started or buf[i] in ",["
+                i += 1
+            pos += i
+            buf = buf[i:]
+            if buf.startswith("]"):
+                return
+            if buf:
+                started = True
+                try:
+                    item, end = decoder.raw_decode(buf)
+                except json.JSONDecodeError as e:
+                    if eof:
+                        raise ValueError(f"{path}: malformed entry at byte {pos}") from e
+                else:
+                    pos += len(buf[:end].encode("utf-8"))
+                    buf = buf[end:]
+                    yield item, pos
+                    continue
+            if eof:
+                if started:
+                    raise ValueError(f"{path}: missing closing ']'")
+                return
+            chunk = f.read(EXPORT_CHUNK_SIZE)
+            eof = not chunk
+            buf += utf8.decode(chunk, final=eof)
+
+def iter_orders(path=ORDERS_JSON):
+    for order, _ in iter_json_array(path):
+        yield order
+
+def write_orders(orders, path=ORDERS_JSON):
+    """Stream orders into a JSON array file via a temp file, returning the count written"""
+    tmp_path = path + ".tmp"
+    count = 0
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("[")
+            for order in orders:
+                f.write(",\n  " if count else "\n  ")
+                f.write(json.dumps(order, ensure_ascii=False, indent=2).replace("\n", "\n  "))
+                count += 1
+            f.write("\n]" if count else "]")
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return count
+
+def append_orders(orders, path=ORDERS_JSON):
+    """Append orders to a JSON array file in place, without rewriting the existing entries"""
+    if not orders:
+        return
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        write_orders(orders, path)
+        return
+    with open(path, "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - 4096))
+        tail = f.read()
+        body = tail.rstrip()
+        if not body.endswith(b"]"):
+            raise ValueError(f"{path} is not a JSON array")
+        empty = body[:-1].rstrip().endswith(b"[")
+        f.seek(size - len(tail) + len(body) - 1)
+        f.truncate()
+        items = ",\n  ".join(json.dumps(o, ensure_ascii=False, indent=2).replace("\n", "\n  ") for o in orders)
+        f.write((("\n  " if empty else ",\n  ") + items + "\n]").encode("utf-8"))
+
+def parse_date_filter(value, end=False):
+    """Parse a Jalali (1403/01/15) or Gregorian (2024-04-03) date into an ISO bound"""
+    if not value:
+        return None
+    value = value.strip().translate(PERSIAN_NORMALIZE_TABLE)
+    if "/" in value:
+        day = jdatetime.strptime(value, "%Y/%m/%d").togregorian()
+    else:
+        day = datetime.strptime(value, "%Y-%m-%d")
+    if end:
+        day += timedelta(days=1)
+    return day.isoformat()
+
+def filter_orders(start=None, end=None, status=None):
+    """Stream matching orders from every shard, merged by date"""
+    if SHARD_COUNT == 1:
+        return local_filter_orders(start, end, status)
+    filters = {"start": start, "end": end, "status": status}
+    streams = [
+        local_filter_orders(start, end, status) if shard == SHARD_INDEX else stream_shard_orders(shard, filters)
+        for shard in range(SHARD_COUNT)
+    ]
+    return heapq.merge(*streams, key=lambda o: o.get('date', ''))
+
+def local_filter_orders(start=None, end=None, status=None):
+    """Stream orders whose Gregorian date is in [start, end) and status matches"""
+    for order in iter_orders():
+        date = order.get('date', '')
+        if start and date < start:
+            continue
+        if end and date >= end:
+            continue
+        if status and order.get('status', 'pending') != status:
+            continue
+        yield order
+
+def export_orders(fmt="csv", start=None, end=None, status=None):
+    """Yield CSV or JSONL text in chunks of roughly EXPORT_CHUNK_SIZE characters"""
+    buf = io.StringIO()
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(buf, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+    for order in filter_orders(start, end, status):
+        if writer:
+            writer.writerow({**order, "attachments": json.dumps(order.get("attachments") or [], ensure_ascii=False)})
+        else:
+            buf.write(json.dumps(order, ensure_ascii=False) + "\n")
+        if buf.tell() >= EXPORT_CHUNK_SIZE:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+def read_import_records(lines, fmt):
+    """Parse CSV/JSONL import lines into order dicts, restoring the types CSV flattens to text"""
+    if fmt != "csv":
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+        return
+    for record in csv.DictReader(lines):
+        price = (record.pop('price', None) or '').strip()
+        if price:
+            record['price'] = int(price)
+        attachments = (record.get('attachments') or '').strip()
+        record['attachments'] = json.loads(attachments) if attachments else []
+        yield record
+
+def import_orders(lines, fmt="jsonl"):
+    """Append orders streamed from CSV/JSONL lines, skipping ones without or with a known order_id
+
+    The upload is spooled to a temp file first, so store_lock is held only for the rewrite
+    and nothing is indexed until the rewrite has committed.
+    """
+    result = {"imported": 0, "skipped": 0}
+
+    records = read_import_records(lines, fmt)
+
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as spool:
+        for record in records:
+            order_id = (record.get('order_id') or '').strip()
+            if not order_id:
+                result["skipped"] += 1
+                continue
+            record['order_id'] = order_id
+            record['status'] = record.get('status') or 'pending'
+            record['status_text'] = record.get('status_text') or 'در انتظار بررسی'
+            spool.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        imported = set()
+        added = {}
+
+        def merged():
+            existing = set()
+            for order in iter_orders():
+                existing.add(order['order_id'])
+                yield order
+            spool.seek(0)
+            for line in spool:
+                record = json.loads(line)
+                if record['order_id'] in existing:
+                    result["skipped"] += 1
+                    continue
+                existing.add(record['order_id'])
+                imported.add(record['order_id'])
+                apply_rollup(added, record, 1)
+                yield record
+
+        with store_lock:
+            write_orders(merged())
+            rollups = load_analytics()
+            if rollups is None:
+                rebuild_analytics()
+            else:
+                save_analytics(merge_rollups([rollups, added]))
+        result["imported"] = len(imported)
+
+        def committed():
+            spool.seek(0)
+            for line in spool:
+                record = json.loads(line)
+                if record['order_id'] in imported:
+                    imported.discard(record['order_id'])
+                    refresh_index(record)
+                    yield record
+
+        arm_reminders(committed())
+    return result
+
+def import_sharded(lines, fmt="jsonl"):
+    """Split an import by owning shard and import each part on its shard
+
+    A shard failure aborts the rest; running the import again is safe since known order IDs are skipped.
+    """
+    records = read_import_records(lines, fmt)
+    parts = [tempfile.TemporaryFile() for _ in range(SHARD_COUNT)]
+    try:
+        for record in records:
+            shard = shard_for_chat(record.get('chat_id') or '')
+            parts[shard].write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        result = {"imported": 0, "skipped": 0}
+        for shard, part in enumerate(parts):
+            part.seek(0)
+            if shard == SHARD_INDEX:
+                shard_result = import_orders(io.TextIOWrapper(part, encoding="utf-8", newline=""))
+            else:
+                # No read timeout: the shard answers only after rewriting its whole store
+                response = requests.post(
+                    f"{shard_url(shard)}/internal/import",
+                    data=part,
+                    headers={"X-Shard-Key": SHARD_SECRET, "Content-Type": "application/x-ndjson"},
+                    timeout=(SHARD_TIMEOUT, None)
+                )
+                response.raise_for_status()
+                shard_result = response.json()["result"]
+            result["imported"] += shard_result["imported"]
+            result["skipped"] += shard_result["skipped"]
+        return result
+    finally:
+        for part in parts:
+            part.close()
+
+def export_to_file(fmt="csv", start=None, end=None, status=None):
+    """Write an export to a temp file chunk by chunk and return its path"""
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            for chunk in export_orders(fmt, start, end, status):
+                f.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+def parse_export_command(text):
+    """Parse '/export [csv|jsonl] [from] [to] [status]' into export arguments"""
+    fmt, status, dates = "csv", None, []
+    for arg in text.split()[1:]:
+        if arg.lower() in ("csv", "jsonl"):
+            fmt = arg.lower()
+        elif arg in ORDER_STATUSES:
+            status = arg
+        else:
+            dates.append(arg)
+    start = parse_date_filter(dates[0]) if dates else None
+    end = parse_date_filter(dates[1], end=True) if len(dates) > 1 else None
+    return fmt, start, end, status
+
+def check_admin_key():
+    key = request.headers.get("X-Admin-Key", "")
+    return bool(ADMIN_API_KEY) and hmac.compare_digest(key.encode("utf-8"), ADMIN_API_KEY.encode("utf-8"))
+
+def find_order(order_id):
+    for order in iter_orders():
+        if order['order_id'] == order_id:
+            return order
+    return None
+
+def shard_hash(key):
+    return int.from_bytes(hashlib.md5(str(key).encode("utf-8")).digest()[:8], "big")
+
+def build_shard_ring(count):
+    """Consistent-hash ring with SHARD_VNODES virtual nodes per shard"""
+    return sorted((shard_hash(f"shard-{shard}-{vnode}"), shard) for shard in range(count) for vnode in range(SHARD_VNODES))
+
+shard_ring = build_shard_ring(SHARD_COUNT)
+shard_ring_keys = [key for key, _ in shard_ring]
+
+def shard_for_chat(chat_id):
+    i = bisect.bisect(shard_ring_keys, shard_hash(chat_id)) % len(shard_ring)
+    return shard_ring[i][1]
+
+def shard_url(shard):
+    return f"http://127.0.0.1:{SHARD_BASE_PORT + shard}"
+
+def update_chat_id(update):
+    """The chat an incoming Telegram update belongs to, used to pick its shard"""
+    if "callback_query" in update:
+        return str(update["callback_query"]["from"]["id"])
+    for key in ("message", "edited_message"):
+        if key in update:
+            return str(update[key]["chat"]["id"])
+    return None
+
+def run_internal_op(op, payload):
+    """Answer a scatter-gather query against this shard's own store"""
+    if op == "recent":
+        return list(deque(iter_orders(), maxlen=payload.get("limit", 10)))
+    elif op == "stats":
+        return local_order_stats()
+    elif op == "active":
+        return [
+            {"order_id": o["order_id"], "name": o.get("name", "نامشخص"), "status": o.get("status", "pending"), "date": o.get("date", "")}
+            for o in iter_orders() if o.get("status", "pending") in ["pending", "priced"]
+        ]
+    elif op == "find":
+        return find_order(payload["order_id"])
+    elif op == "search":
+        return rank_orders(payload["query"])
+    elif op == "analytics":
+        return local_analytics()
+    elif op == "rebuild_analytics":
+        return rebuild_analytics()
+    elif op == "recipients":
+        return local_broadcast_recipients(payload.get("status"))
+    elif op == "metrics":
+        return get_scheduler_metrics()
+    elif op == "update_status":
+        if not find_order(payload["order_id"]):
+            return False
+        update_order_status(payload["order_id"], payload["status"], payload["status_text"], payload.get("price"))
+        return True
+    raise ValueError(f"unknown internal op: {op}")
+
+def stream_shard_orders(shard, filters):
+    """Stream another shard's matching orders from its /internal/orders JSONL endpoint"""
+    with requests.post(
+        f"{shard_url(shard)}/internal/orders",
+        json=filters,
+        headers={"X-Shard-Key": SHARD_SECRET},
+        stream=True,
+        timeout=SHARD_TIMEOUT
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+def scatter(op, payload=None):
+    """Run an internal op on every shard in parallel; shards that fail yield None"""
+    def call(shard):
+        try:
+            if shard == SHARD_INDEX:
+                return run_internal_op(op, payload or {})
+            response = requests.post(
+                f"{shard_url(shard)}/internal/{op}",
+                json=payload or {},
+                headers={"X-Shard-Key": SHARD_SECRET},
+                timeout=SHARD_TIMEOUT
+            )
+            response.raise_for_status()
+            return response.json()["result"]
+        except Exception:
+            app.logger.exception("Shard %s failed on %s", shard, op)
+            return None
+    return list(shard_executor.map(call, range(SHARD_COUNT)))
+
+def missing_shards(results):
+    """Shards whose scatter result is missing because the shard failed"""
+    return [shard for shard, result in enumerate(results) if result is None]
+
+def format_missing_shards(missing):
+    if not missing:
+        return ""
+    return f"\n\n⚠️ <b>نتایج ناقص:</b> بخش‌های {', '.join(map(str, missing))} پاسخ ندادند و در این نتایج حساب نشده‌اند."
+
+def recent_orders(limit):
+    """The last `limit` orders and the list of shards that could not be reached"""
+    if SHARD_COUNT == 1:
+        return run_internal_op("recent", {"limit": limit}), []
+    results = scatter("recent", {"limit": limit})
+    orders = [o for result in results for o in result or []]
+    return sorted(orders, key=lambda o: o.get('date', ''))[-limit:], missing_shards(results)
+
+def active_orders():
+    """Pending and priced orders and the list of shards that could not be reached"""
+    if SHARD_COUNT == 1:
+        return run_internal_op("active", {}), []
+    results = scatter("active")
+    orders = [o for result in results for o in result or []]
+    return sorted(orders, key=lambda o: o['date']), missing_shards(results)
+
+def lookup_order(order_id):
+    """Find an order in this shard's store, falling back to the other shards"""
+    order = find_order(order_id)
+    if order or SHARD_COUNT == 1:
+        return order
+    return next((o for o in scatter("find", {"order_id": order_id}) if o), None)
+
+def set_order_status(order_id, status, status_text, price=None):
+    """Update an order's status on whichever shard owns it"""
+    if SHARD_COUNT == 1:
+        update_order_status(order_id, status, status_text, price)
+    else:
+        scatter("update_status", {"order_id": order_id, "status": status, "status_text": status_text, "price": price})
+
+def schedule_timer(key, delay, kind, payload):
+    """Schedule (or reschedule) the timer `key` to fire `delay` seconds from now"""
+    due = time.time() + delay
+    with timer_lock:
+        timers[key] = {"due": due, "kind": kind, "payload": payload}
+        heapq.heappush(timer_heap, (due, key))
+        timer_changes[key] = True
+
+def append_timer_payload(key, field, item):
+    """Append to a list in a pending timer's payload; returns False if no such timer is pending"""
+    with timer_lock:
+        timer = timers.get(key)
+        if not timer:
+            return False
+        timer["payload"][field].append(item)
+        timer_changes[key] = True
+        return True
+
+def cancel_timer(key):
+    with timer_lock:
+        if timers.pop(key, None):
+            timer_changes[key] = True
+
+def pop_due_timers(now):
+    """Remove and return timers due by `now`; stale heap entries are skipped"""
+    global timer_heap
+    due_timers = []
+    with timer_lock:
+        while timer_heap and timer_heap[0][0] <= now:
+            due, key = heapq.heappop(timer_heap)
+            timer = timers.get(key)
+            if timer and timer["due"] == due:
+                del timers[key]
+                due_timers.append(timer)
+                timer_changes[key] = True
+        # Cancelled and rescheduled timers leave entries behind; compact when they pile up
+        if len(timer_heap) > 2 * len(timers) + 1024:
+            timer_heap = [(t["due"], k) for k, t in timers.items()]
+            heapq.heapify(timer_heap)
+    return due_timers
+
+def run_due_timers():
+    now = time.time()
+    for timer in pop_due_timers(now):
+        lag = now - timer["due"]
+        scheduler_metrics["lag"] = lag
+        scheduler_metrics["max_lag"] = max(scheduler_metrics["max_lag"], lag)
+        try:
+            fire_timer(timer["kind"], timer["payload"])
+            scheduler_metrics["fired"] += 1
+        except Exception:
+            scheduler_metrics["failed"] += 1
+            app.logger.exception("Timer %s failed", timer["kind"])
+
+def fire_timer(kind, payload):
+    if kind == "order_reminder":
+        order = find_order(payload["order_id"])
+        if order and order.get("status", "pending") == "pending":
+            reminder_text = f"""
+⏰ <b>یادآوری سفارش در انتظار!</b>
+
+🔖 <b>شناسه:</b> <code>{order['order_id']}</code>
+👤 {order.get('name', '')} | 📱 {order.get('phone', '')}
+📅 <b>تاریخ ثبت:</b> {order.get('jalali_date', '')}
+
+این سفارش بیش از {PENDING_REMINDER_HOURS:g} ساعت است که بررسی نشده.
+            """
+            for admin_chat_id in ADMIN_CHAT_IDS:
+                send_message(admin_chat_id, reminder_text)
+            schedule_timer(f"reminder:{order['order_id']}", PENDING_REMINDER_HOURS * 3600, "order_reminder", payload)
+
+    elif kind == "admin_digest":
+        flush_digest(payload["chat_id"], payload["orders"])
+
+    elif kind == "discard_attachments":
+        discard_attachments(payload["chat_id"])
+
+    elif kind == "session_nudge":
+        sess = sessions.get(payload["chat_id"])
+        if sess and sess.get("step") == payload["step"]:
+            send_message(payload["chat_id"], "⏰ <b>سفارش شما هنوز تکمیل نشده است!</b>\nلطفاً از همان مرحله ادامه دهید یا برای شروع مجدد 'شروع مجدد' را انتخاب کنید.", get_menu_keyboard())
+
+def schedule_nudge(chat_id, sess):
+    """Remind a user who stops mid-form to finish their order"""
+    step = sess.get("step") if sess else None
+    if step and step not in NUDGE_SKIP_STEPS:
+        schedule_timer(f"nudge:{chat_id}", NUDGE_MINUTES * 60, "session_nudge", {"chat_id": chat_id, "step": step})
+    else:
+        cancel_timer(f"nudge:{chat_id}")
+
+def save_timers():
+    """Append the timers changed since the last save to the journal, compacting it once it outgrows the table"""
+    global timers_journal_size
+    with timer_lock:
+        # Serialized under the lock since digest payloads keep growing in place
+        changes = {key: json.dumps({"key": key, "timer": timers.get(key)}, ensure_ascii=False) for key in timer_changes}
+        timer_changes.clear()
+        compact = timers_journal_size is None or timers_journal_size + len(changes) > max(TIMERS_COMPACT_MIN, len(timers))
+        snapshot = dict(timers) if compact else None
+    try:
+        if compact:
+            compact_timers(snapshot)
+        else:
+            with open(TIMERS_JOURNAL, "a", encoding="utf-8") as f:
+                f.write("".join(line + "\n" for line in changes.values()))
+            timers_journal_size += len(changes)
+    except OSError:
+        # Retry on the next save interval without clobbering newer changes
+        with timer_lock:
+            for key in changes:
+                timer_changes.setdefault(key, True)
+        raise
+
+def compact_timers(snapshot):
+    """Rewrite the full timer table and start a new, empty journal generation"""
+    global timers_generation, timers_journal_size
+    generation = timers_generation + 1
+    tmp_path = TIMERS_JSON + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"generation": generation, "timers": snapshot}, f, ensure_ascii=False)
+    os.replace(tmp_path, TIMERS_JSON)
+    # A journal from an older generation is ignored on load, so a crash between these two writes is safe
+    with open(TIMERS_JOURNAL, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"generation": generation}) + "\n")
+    timers_generation = generation
+    timers_journal_size = 0
+
+def load_timers():
+    """Load the last compacted table and replay the journal written after it"""
+    global timer_heap, timers_generation, timers_journal_size
+    try:
+        with open(TIMERS_JSON, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        saved = {}
+    if "generation" in saved:
+        timers_generation = saved["generation"]
+        saved = saved["timers"]
+    try:
+        with open(TIMERS_JOURNAL, "r", encoding="utf-8") as f:
+            lines = iter(f)
+            header = json.loads(next(lines, "{}"))
+            if header.get("generation") == timers_generation:
+                timers_journal_size = 0
+                for line in lines:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # torn write at the tail
+                    timers_journal_size += 1
+                    if entry["timer"] is None:
+                        saved.pop(entry["key"], None)
+                    else:
+                        saved[entry["key"]] = entry["timer"]
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    with timer_lock:
+        timers.update(saved)
+        timer_heap = [(t["due"], k) for k, t in timers.items()]
+        heapq.heapify(timer_heap)
+        if timers_journal_size is None and timers:
+            # No journal for this table yet (e.g. the old single-file format), so compact on the first save
+            timer_changes[next(iter(timers))] = True
+
+def reminder_delay(order):
+    """Seconds until a pending order's reminder is due, counted from when the order was placed"""
+    try:
+        placed = datetime.fromisoformat(order.get('date', '')).timestamp()
+    except (TypeError, ValueError):
+        return 0
+    return max(0, placed + PENDING_REMINDER_HOURS * 3600 - time.time())
+
+def arm_reminders(orders):
+    """Schedule reminders for pending orders that have none, spacing out overdue ones"""
+    with timer_lock:
+        armed = {key for key in timers if key.startswith("reminder:")}
+    overdue = 0
+    for order in orders:
+        key = f"reminder:{order['order_id']}"
+        if order.get('status', 'pending') != 'pending' or key in armed:
+            continue
+        delay = reminder_delay(order)
+        if not delay:
+            # Don't flood the admins with every overdue order at once
+            delay = overdue * REMINDER_SEED_SPACING
+            overdue += 1
+        schedule_timer(key, delay, "order_reminder", {"order_id": order['order_id']})
+
+def scheduler_loop():
+    last_save = time.time()
+    try:
+        # Orders saved before reminders existed, or imported/migrated since, have no reminder yet
+        arm_reminders(iter_orders())
+    except Exception:
+        app.logger.exception("Could not arm reminders for pending orders")
+    while True:
+        try:
+            run_due_timers()
+            if timer_changes and time.time() - last_save >= TIMERS_SAVE_INTERVAL:
+                last_save = time.time()
+                save_timers()
+        except Exception:
+            app.logger.exception("Scheduler tick failed")
+        time.sleep(SCHEDULER_TICK)
+
+def start_scheduler():
+    """Load persisted timers, start the scheduler thread and resume any broadcast, once per process"""
+    global scheduler_thread, store_process_lock
+    with timer_lock:
+        if scheduler_thread:
+            return
+        scheduler_thread = threading.Thread(target=scheduler_loop, daemon=True)
+    # Held for the life of the process; waits while a migration is appending to the store
+    store_process_lock = lock_store_process(SHARD_SUFFIX)
+    load_timers()
+    # Uploads of sessions lost in a restart can never be attached to an order
+    shutil.rmtree(ATTACHMENTS_PENDING_DIR, ignore_errors=True)
+    scheduler_thread.start()
+    resume_broadcast()
+
+def get_scheduler_metrics():
+    with timer_lock:
+        by_kind = {}
+        for timer in timers.values():
+            by_kind[timer["kind"]] = by_kind.get(timer["kind"], 0) + 1
+        next_due = timer_heap[0][0] - time.time() if timer_heap else None
         return {
-            'total': total,
-            'today': today_orders,
-            'pending': status_count.get('pending', 0),
-            'priced': status_count.get('priced', 0),
-            'completed': status_count.get('completed', 0),
-            'rejected': status_count.get('rejected', 0)
+            "timers": len(timers),
+            "heap_size": len(timer_heap),
+            "by_kind": by_kind,
+            "next_due_in": next_due,
+            **scheduler_metrics
         }
+
+def take_token(key, rate, capacity):
+    """Token bucket: refill `rate` tokens per second up to `capacity`, and take one if available"""
+    global rate_buckets_swept
+    now = time.time()
+    with rate_lock:
+        tokens, updated, _ = rate_buckets.get(key, (capacity, now, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        full_at = now + (capacity - tokens) / rate if rate else float("inf")
+        rate_buckets[key] = (tokens, now, full_at)
+        if now - rate_buckets_swept >= RATE_BUCKET_SWEEP_INTERVAL:
+            rate_buckets_swept = now
+            for stale in [k for k, bucket in rate_buckets.items() if bucket[2] <= now]:
+                del rate_buckets[stale]
+    return allowed
+
+def format_admin_order(order, title="🆕 <b>سفارش جدید دریافت شد!</b>"):
+    return f"""
+{title}
+
+🔖 <b>شناسه:</b> <code>{order.get('order_id', '')}</code>
+📅 <b>تاریخ:</b> {order.get('jalali_date', '')}
+
+👤 <b>اطلاعات مشتری:</b>
+├ نام: {order.get('name', '')}
+├ تلگرام: {order.get('telegram_username', '')}
+├ شماره: {order.get('phone', '')}
+└ ایمیل: {order.get('email', 'ندارد')}
+
+💼 <b>جزئیات پروژه:</b>
+├ کسب‌وکار: {order.get('business', '')}
+├ هدف: {order.get('purpose', '')}
+├ ویژگی‌ها: {order.get('features', '')}
+├ دامنه/هاست: {order.get('domain', '')}
+├ پشتیبانی: {order.get('support', '')}
+└ توضیحات: {order.get('extra', 'ندارد')}
+
+{format_attachments(order.get('attachments'))}🔗 <b>Chat ID:</b> <code>{order.get('chat_id', '')}</code>
+        """
+
+def format_attachments(attachments):
+    if not attachments:
+        return ""
+    text = f"📎 <b>پیوست‌ها ({len(attachments)}):</b>\n"
+    for i, attachment in enumerate(attachments):
+        branch = "└" if i == len(attachments) - 1 else "├"
+        text += f"{branch} {html.escape(attachment['name'])} ({attachment['size'] // 1024} KB): <code>{html.escape(attachment['path'])}</code>\n"
+    return text + "\n"
+
+def notify_new_order(order):
+    """Send a new order to every admin, switching to periodic digests above the rate limit"""
+    notify_admins(format_admin_order(order), {"order_id": order['order_id'], "name": order.get('name', ''), "business": order.get('business', '')})
+
+def notify_admins(admin_text, summary):
+    """Send `admin_text` to every admin, or queue `summary` for their digest while they are over the rate limit"""
+    for admin_chat_id in ADMIN_CHAT_IDS:
+        key = f"digest:{admin_chat_id}"
+        with notify_lock:
+            queued = append_timer_payload(key, "orders", summary)
+            send_now = not queued and take_token(f"notify:{admin_chat_id}", NOTIFY_RATE_PER_MINUTE / 60, NOTIFY_RATE_PER_MINUTE)
+            if not queued and not send_now:
+                schedule_timer(key, DIGEST_INTERVAL, "admin_digest", {"chat_id": admin_chat_id, "orders": [summary]})
+        if send_now:
+            send_message(admin_chat_id, admin_text)
+
+def flush_digest(admin_chat_id, queue):
+    for i in range(0, len(queue), DIGEST_MAX_ORDERS):
+        batch = queue[i:i + DIGEST_MAX_ORDERS]
+        text = f"🗂 <b>خلاصه سفارشات جدید:</b> {len(batch)} سفارش\n"
+        for item in batch:
+            text += f"\n🔖 <code>{item['order_id']}</code> | 👤 {html.escape(item['name'])} | 💼 {html.escape(item['business'])}"
+            if item.get('attachments'):
+                text += f" | 📎 {item['attachments']} فایل"
+        keyboard = create_glass_keyboard([
+            [{"text": f"📄 {item['order_id']}", "callback": f"view_order_{item['order_id']}"}]
+            for item in batch
+        ])
+        send_message(admin_chat_id, text, keyboard)
+
+def broadcast_recipients(status=None):
+    """Unique customer chat IDs from every shard, optionally limited to one order status"""
+    if SHARD_COUNT == 1:
+        return local_broadcast_recipients(status)
+    recipients = [chat_id for result in scatter("recipients", {"status": status}) for chat_id in result or []]
+    return list(dict.fromkeys(recipients))
+
+def local_broadcast_recipients(status=None):
+    """Unique customer chat IDs from this shard's store, optionally limited to one order status"""
+    seen = set()
+    recipients = []
+    for order in iter_orders():
+        chat_id = order.get('chat_id')
+        if not chat_id or chat_id in seen:
+            continue
+        if status and order.get('status', 'pending') != status:
+            continue
+        seen.add(chat_id)
+        recipients.append(chat_id)
+    return recipients
+
+def save_broadcast():
+    tmp_path = BROADCAST_JSON + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(broadcast_state, f, ensure_ascii=False)
+    os.replace(tmp_path, BROADCAST_JSON)
+
+def start_broadcast(admin_chat_id, text, status=None):
+    """Start sending `text` to every customer; returns False if one is already running"""
+    global broadcast_thread
+    if broadcast_thread and broadcast_thread.is_alive():
+        return False
+    broadcast_state.clear()
+    broadcast_state.update({
+        "admin_chat_id": admin_chat_id,
+        "text": text,
+        "status": status,
+        "recipients": broadcast_recipients(status),
+        "position": 0,
+        "sent": 0,
+        "failed": 0,
+        "blocked": 0,
+        "state": "running",
+        "started": jdatetime.now().strftime("%Y/%m/%d %H:%M:%S")
+    })
+    save_broadcast()
+    broadcast_cancel.clear()
+    broadcast_thread = threading.Thread(target=run_broadcast, daemon=True)
+    broadcast_thread.start()
+    return True
+
+def resume_broadcast():
+    """Continue a broadcast interrupted by a restart from its last saved position"""
+    global broadcast_thread
+    try:
+        with open(BROADCAST_JSON, "r", encoding="utf-8") as f:
+            saved = json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
-        return {'total': 0, 'today': 0, 'pending': 0, 'priced': 0, 'completed': 0, 'rejected': 0}
+        return
+    broadcast_state.update(saved)
+    if saved.get("state") == "running" and not (broadcast_thread and broadcast_thread.is_alive()):
+        broadcast_thread = threading.Thread(target=run_broadcast, daemon=True)
+        broadcast_thread.start()
 
-def update_order_status(order_id, status, status_text):
-    """Update order status in JSON file"""
+def deliver_broadcast(chat_id, text):
+    """Send one broadcast message, returning 'sent', 'blocked' or 'failed' (retrying on 429)"""
+    while True:
+        while not take_token("broadcast", BROADCAST_RATE_PER_SECOND, BROADCAST_RATE_PER_SECOND):
+            time.sleep(1 / BROADCAST_RATE_PER_SECOND)
+        while not take_token(f"chat:{chat_id}", 1, 1):
+            time.sleep(0.1)
+        try:
+            response = send_message(chat_id, text)
+            data = response.json()
+        except (requests.RequestException, ValueError):
+            return "failed"
+        if data.get("ok"):
+            return "sent"
+        if response.status_code == 429:
+            # Wait out the flood limit, but let a cancel take effect meanwhile
+            if broadcast_cancel.wait(data.get("parameters", {}).get("retry_after", 1)):
+                return "failed"
+            continue
+        if response.status_code == 403:
+            return "blocked"
+        return "failed"
+
+def run_broadcast():
+    state = broadcast_state
+    recipients = state["recipients"]
+    while state["position"] < len(recipients):
+        if broadcast_cancel.is_set():
+            state["state"] = "cancelled"
+            break
+        result = deliver_broadcast(recipients[state["position"]], state["text"])
+        state[result] += 1
+        state["position"] += 1
+        if state["position"] % BROADCAST_SAVE_EVERY == 0:
+            save_broadcast()
+    else:
+        state["state"] = "done"
+    save_broadcast()
+    send_message(state["admin_chat_id"], format_broadcast_status(), get_admin_menu_keyboard())
+
+def format_broadcast_status():
+    state = broadcast_state
+    if not state:
+        return "📣 <b>هیچ ارسال همگانی انجام نشده است.</b>"
+    state_text = {"running": "⏳ در حال ارسال", "done": "✅ پایان یافته", "cancelled": "🚫 لغو شده"}
+    return f"""
+📣 <b>وضعیت ارسال همگانی:</b> {state_text.get(state['state'], state['state'])}
+
+📅 <b>شروع:</b> {state.get('started', '')}
+👥 <b>گیرندگان:</b> {state['position']} از {len(state['recipients'])}
+├ ✅ ارسال شده: {state['sent']}
+├ ⛔️ مسدود کرده: {state['blocked']}
+└ ❌ ناموفق: {state['failed']}
+    """
+
+def get_broadcast_target_keyboard():
+    return create_glass_keyboard([
+        [{"text": "👥 همه مشتریان", "callback": "broadcast_target_all"}],
+        [{"text": "⏳ در انتظار", "callback": "broadcast_target_pending"}, {"text": "💰 قیمت اعلام شده", "callback": "broadcast_target_priced"}],
+        [{"text": "✅ تکمیل شده", "callback": "broadcast_target_completed"}, {"text": "❌ رد شده", "callback": "broadcast_target_rejected"}],
+        [{"text": "📊 وضعیت آخرین ارسال", "callback": "broadcast_status"}]
+    ])
+
+def get_broadcast_progress_keyboard():
+    return create_glass_keyboard([
+        [{"text": "📊 وضعیت", "callback": "broadcast_status"}, {"text": "🚫 توقف ارسال", "callback": "broadcast_cancel"}]
+    ])
+
+def get_attachment_info(message):
+    """Return (file_id, file_name, file_size) for a document or photo message, else None"""
+    if "document" in message:
+        document = message["document"]
+        return document["file_id"], document.get("file_name", ""), document.get("file_size", 0)
+    if message.get("photo"):
+        photo = message["photo"][-1]  # largest size
+        return photo["file_id"], f"photo_{photo['file_unique_id']}.jpg", photo.get("file_size", 0)
+    return None
+
+def download_attachment(chat_id, file_id, file_name):
+    """Stream a Telegram file into the chat's pending dir in chunks, named by SHA-256 of its content"""
+    data = requests.get(
+        f"https://api.telegram.org/bot{TOKEN}/getFile",
+        params={"file_id": file_id},
+        timeout=30
+    ).json()
+    if not data.get("ok"):
+        raise ValueError(data.get("description", "getFile failed"))
+    file_path = data["result"]["file_path"]
+
+    pending_dir = os.path.join(ATTACHMENTS_PENDING_DIR, str(chat_id))
+    os.makedirs(pending_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=pending_dir, suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
     try:
-        with open(ORDERS_JSON, "r", encoding="utf-8") as f:
-            orders = json.load(f)
-        
-        for order in orders:
+        with os.fdopen(fd, "wb") as f, requests.get(
+            f"https://api.telegram.org/file/bot{TOKEN}/{file_path}",
+            stream=True,
+            timeout=60
+        ) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(ATTACHMENT_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_ATTACHMENT_BYTES:
+                    raise ValueError("attachment too large")
+                digest.update(chunk)
+                f.write(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+    ext = os.path.splitext(file_name or file_path)[1].lower()
+    path = os.path.join(pending_dir, digest.hexdigest() + ext)
+    os.replace(tmp_path, path)
+    return {"name": file_name or os.path.basename(file_path), "path": path, "size": size, "file_id": file_id}
+
+def queue_attachment(chat_id, file_id, file_name):
+    attachment_jobs.setdefault(chat_id, []).append(
+        attachment_executor.submit(download_attachment, chat_id, file_id, file_name)
+    )
+    schedule_timer(f"attachments:{chat_id}", ATTACHMENT_ABANDON_HOURS * 3600, "discard_attachments", {"chat_id": chat_id})
+
+def discard_attachments(chat_id):
+    """Drop a chat's uploads for an order that was cancelled or abandoned, deleting each file once downloaded"""
+    cancel_timer(f"attachments:{chat_id}")
+    for job in attachment_jobs.pop(chat_id, []):
+        job.cancel()
+        job.add_done_callback(remove_pending_download)
+
+def remove_pending_download(job):
+    try:
+        path = job.result()["path"]
+    except Exception:
+        return  # cancelled or failed downloads leave nothing behind
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def attach_when_done(order_id, jobs):
+    """Link a saved order to its downloads once they all finish, without blocking the caller"""
+    if not jobs:
+        return
+    remaining = [len(jobs)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        try:
+            finish_attachments(order_id, jobs)
+        except Exception:
+            app.logger.exception("Attaching files to order %s failed", order_id)
+
+    for job in jobs:
+        job.add_done_callback(done)
+
+def finish_attachments(order_id, jobs):
+    attachments = []
+    paths = set()
+    for job in jobs:
+        try:
+            attachment = job.result()
+        except Exception:
+            app.logger.warning("Attachment download failed for order %s", order_id, exc_info=True)
+            continue
+        # Move the upload out of the pending dir into the shared, content-addressed store
+        path = os.path.join(ATTACHMENTS_DIR, os.path.basename(attachment["path"]))
+        if os.path.exists(path):
+            os.remove(attachment["path"])
+        else:
+            os.replace(attachment["path"], path)
+        attachment["path"] = path
+        if path not in paths:
+            paths.add(path)
+            attachments.append(attachment)
+    if not attachments:
+        return
+    saved = []
+
+    def rewritten():
+        for order in iter_orders():
             if order['order_id'] == order_id:
-                order['status'] = status
-                order['status_text'] = status_text
-                break
-        
-        with open(ORDERS_JSON, "w", encoding="utf-8") as f:
-            json.dump(orders, f, ensure_ascii=False, indent=2)
-    except (FileNotFoundError, json.JSONDecodeError):
+                order['attachments'] = attachments
+                saved.append(order)
+            yield order
+
+    with store_lock:
+        write_orders(rewritten())
+    if not saved:
+        return
+    order = saved[0]
+    notify_admins(
+        f"📎 <b>فایل‌های سفارش</b> <code>{order_id}</code> <b>دریافت شد:</b>\n\n{format_attachments(attachments)}",
+        {"order_id": order_id, "name": order.get('name', ''), "business": order.get('business', ''), "attachments": len(attachments)}
+    )
+
+def get_attachments_keyboard():
+    return create_glass_keyboard([
+        [{"text": "✅ ادامه", "callback": "attachments_done"}]
+    ])
+
+def parse_txt_order(block):
+    """Parse one legacy orders.txt block of 'Key: value' lines into an order dict"""
+    order = {}
+    field = None
+    for line in block.splitlines():
+        key, sep, value = line.partition(": ")
+        if not sep and line.endswith(":"):
+            key, sep, value = line[:-1], ":", ""
+        if sep and key.strip() in TXT_ORDER_FIELDS:
+            field = TXT_ORDER_FIELDS[key.strip()]
+            order[field] = value.strip()
+        elif field and line.strip():
+            order[field] += "\n" + line.strip()
+    if not order.get("order_id"):
+        return None
+    try:
+        order["date"] = datetime.strptime(order.get("date", ""), "%Y-%m-%d %H:%M:%S").isoformat()
+    except ValueError:
         pass
+    order["status"] = order.get("status") or "pending"
+    order["status_text"] = "در انتظار بررسی" if order["status"] == "pending" else order["status"]
+    return order
+
+def iter_txt_orders(path, offset=0):
+    """Scan orders.txt blocks through mmap, yielding (order, byte offset after the block)"""
+    separator = ("=" * 50 + "\n").encode("utf-8")
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            pos = offset
+            while pos < len(mm):
+                end = mm.find(separator, pos)
+                block_end = len(mm) if end == -1 else end
+                block = mm[pos:block_end].decode("utf-8", errors="replace")
+                pos = len(mm) if end == -1 else end + len(separator)
+                order = parse_txt_order(block)
+                if order:
+                    yield order, pos
+
+def store_suffixes():
+    return [f".shard{shard}" for shard in range(SHARD_COUNT)] if SHARD_COUNT > 1 else [""]
+
+def lock_store_process(suffix, exclusive=False):
+    """flock the store's .lock file: shared by a running bot, exclusive (non-blocking) for migrate
+
+    Returns the open lock file, which holds the lock until it is closed, or None if it is taken.
+    """
+    f = open(f"orders{suffix}.lock", "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB if exclusive else fcntl.LOCK_SH)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+def migrate_orders(txt_path="orders.txt", json_path="orders.json"):
+    """Stream legacy orders into the current store (one file, or one per shard) with resumable checkpoints
+
+    orders.json entries win over orders.txt blocks with the same order_id, since only the
+    JSON file records status changes. Orders already in the store are never duplicated.
+
+    The bot must be stopped: a running bot could rewrite the store over the appended batches,
+    so this refuses to start while any bot process holds the store lock, and a bot starting
+    meanwhile waits for it. Search, reminders and analytics pick the orders up on the next start.
+    """
+    locks = [lock_store_process(suffix, exclusive=True) for suffix in store_suffixes()]
+    if None in locks:
+        for lock in locks:
+            if lock:
+                lock.close()
+        print("The bot is running. Stop it before migrating.")
+        return None
+    try:
+        return migrate_locked(txt_path, json_path)
+    finally:
+        for lock in locks:
+            lock.close()
+
+def migrate_locked(txt_path, json_path):
+    targets = [f"orders{suffix}.json" for suffix in store_suffixes()]
+    try:
+        with open(MIGRATE_CHECKPOINT, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        checkpoint = {"phase": "json", "json_offset": 0, "txt_offset": 0, "migrated": 0, "skipped": 0}
+    if checkpoint["phase"] == "done":
+        print(f"Migration already finished ({checkpoint['migrated']} migrated). Delete {MIGRATE_CHECKPOINT} to run it again.")
+        return checkpoint
+
+    seen = {order['order_id'] for target in targets for order in iter_orders(target)}
+    batches = {target: [] for target in targets}
+    started = time.time()
+    processed = 0
+
+    def flush(phase, offset):
+        for target, batch in batches.items():
+            append_orders(batch, target)
+            batch.clear()
+        checkpoint["phase"] = phase
+        checkpoint[f"{phase}_offset"] = offset
+        with open(MIGRATE_CHECKPOINT, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        rate = processed / max(time.time() - started, 1e-6)
+        print(f"[{phase}] {checkpoint['migrated']} migrated, {checkpoint['skipped']} skipped, {rate:.0f} records/s")
+
+    sources = [("json", iter_json_array, json_path), ("txt", iter_txt_orders, txt_path)]
+    phases = [name for name, _, _ in sources]
+    for name, reader, path in sources[phases.index(checkpoint["phase"]):]:
+        if os.path.abspath(path) in map(os.path.abspath, targets):
+            continue  # already part of the store
+        offset = checkpoint[f"{name}_offset"]
+        buffered = 0
+        for order, offset in reader(path, checkpoint[f"{name}_offset"]):
+            processed += 1
+            order_id = order.get('order_id')
+            if not order_id or order_id in seen:
+                checkpoint["skipped"] += 1
+                continue
+            seen.add(order_id)
+            target = targets[shard_for_chat(order.get('chat_id', '')) if SHARD_COUNT > 1 else 0]
+            batches[target].append(order)
+            checkpoint["migrated"] += 1
+            buffered += 1
+            if buffered >= MIGRATE_BATCH_SIZE:
+                flush(name, offset)
+                buffered = 0
+        flush(name, offset)
+
+    checkpoint["phase"] = "done"
+    with open(MIGRATE_CHECKPOINT, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    # Rollups are rebuilt lazily from the migrated store
+    for suffix in store_suffixes():
+        if os.path.exists(f"analytics{suffix}.json"):
+            os.remove(f"analytics{suffix}.json")
+    print(f"Migration finished: {checkpoint['migrated']} migrated, {checkpoint['skipped']} skipped in {time.time() - started:.1f}s")
+    return checkpoint
 
 def validate_phone(phone):
     phone = phone.strip().replace(" ", "").replace("-", "")
@@ -173,9 +1805,10 @@ def send_message(chat_id, text, keyboard=None):
     }
     if keyboard:
         payload["reply_markup"] = keyboard
-    requests.post(
+    return requests.post(
         f"https://api.telegram.org/bot{TOKEN}/sendMessage",
-        json=payload
+        json=payload,
+        timeout=TELEGRAM_TIMEOUT
     )
 
 def edit_message(chat_id, message_id, text, keyboard=None):
@@ -189,21 +1822,33 @@ def edit_message(chat_id, message_id, text, keyboard=None):
         payload["reply_markup"] = keyboard
     requests.post(
         f"https://api.telegram.org/bot{TOKEN}/editMessageText",
-        json=payload
+        json=payload,
+        timeout=TELEGRAM_TIMEOUT
     )
 
 def answer_callback_query(callback_query_id, text=""):
     requests.post(
         f"https://api.telegram.org/bot{TOKEN}/answerCallbackQuery",
-        json={"callback_query_id": callback_query_id, "text": text}
+        json={"callback_query_id": callback_query_id, "text": text},
+        timeout=TELEGRAM_TIMEOUT
     )
 
+def send_document(chat_id, path, filename, caption=""):
+    with open(path, "rb") as f:
+        requests.post(
+            f"https://api.telegram.org/bot{TOKEN}/sendDocument",
+            data={"chat_id": chat_id, "caption": caption, "parse_mode": "HTML"},
+            files={"document": (filename, f)},
+            timeout=TELEGRAM_TIMEOUT
+        )
+
 def get_user_info(chat_id):
     """Get user information including username"""
     try:
         response = requests.get(
             f"https://api.telegram.org/bot{TOKEN}/getChat",
-            params={"chat_id": chat_id}
+            params={"chat_id": chat_id},
+            timeout=TELEGRAM_TIMEOUT
         )
         data = response.json()
         if data.get("ok"):
@@ -276,6 +1921,8 @@ def get_admin_menu_keyboard():
         "keyboard": [
             [{"text": "📋 مشاهده سفارشات"}, {"text": "📊 آمار سفارشات"}],
             [{"text": "💰 اعلام قیمت"}, {"text": "❌ رد سفارش"}],
+            [{"text": "🔎 جستجوی سفارش"}, {"text": "📤 خروجی سفارشات"}],
+            [{"text": "📈 تحلیل سفارشات"}, {"text": "📣 ارسال همگانی"}],
             [{"text": "🗑 حذف سفارشات قدیمی"}]
         ],
         "resize_keyboard": True,
@@ -284,28 +1931,24 @@ def get_admin_menu_keyboard():
 
 def get_orders_selection_keyboard():
     keyboard_data = []
-    active_orders = []
-    try:
-        with open(ORDERS_JSON, "r", encoding="utf-8") as f:
-            orders = json.load(f)
-        
-        for order in orders:
-            if order.get("status", "pending") in ["pending", "priced"]:
-                order_id = order["order_id"]
-                customer_name = order.get("name", "نامشخص")
-                status_emoji = "⏳" if order.get("status") == "pending" else "💰"
-                active_orders.append({
-                    "text": f"{status_emoji} {order_id} - {customer_name}",
-                    "callback": f"select_order_{order_id}"
-                })
-    except (FileNotFoundError, json.JSONDecodeError):
-        pass
+    active_buttons = []
+    orders, missing = active_orders()
+    if missing:
+        keyboard_data.append([{"text": f"⚠️ بخش‌های {', '.join(map(str, missing))} در دسترس نیستند", "callback": "no_orders"}])
+    for order in orders:
+        order_id = order["order_id"]
+        customer_name = order.get("name", "نامشخص")
+        status_emoji = "⏳" if order.get("status") == "pending" else "💰"
+        active_buttons.append({
+            "text": f"{status_emoji} {order_id} - {customer_name}",
+            "callback": f"select_order_{order_id}"
+        })
     
-    for i in range(0, len(active_orders), 1):
-        row = active_orders[i:i+1]
+    for i in range(0, len(active_buttons), 1):
+        row = active_buttons[i:i+1]
         keyboard_data.append(row)
     
-    if not keyboard_data:
+    if not active_buttons:
         keyboard_data.append([{"text": "❌ سفارش فعالی وجود ندارد", "callback": "no_orders"}])
     return create_glass_keyboard(keyboard_data)
 
@@ -320,6 +1963,7 @@ def get_delete_options_keyboard():
 
 @app.route("/", methods=["POST"])
 def webhook():
+    start_scheduler()
     data = request.get_json()
     if "callback_query" in data:
         return handle_callback_query(data["callback_query"])
@@ -328,9 +1972,11 @@ def webhook():
     message = data["message"]
     chat_id = str(message["chat"]["id"])
     text = message.get("text", "")
-    if chat_id == ADMIN_CHAT_ID:
+    if chat_id in ADMIN_CHAT_IDS:
         return handle_admin_message(chat_id, text)
-    return handle_user_message(chat_id, text, message)
+    result = handle_user_message(chat_id, text, message)
+    schedule_nudge(chat_id, sessions.get(chat_id))
+    return result
 
 def handle_callback_query(callback_query):
     chat_id = str(callback_query["from"]["id"])
@@ -339,10 +1985,12 @@ def handle_callback_query(callback_query):
     callback_query_id = callback_query["id"]
     answer_callback_query(callback_query_id)
     
-    if chat_id == ADMIN_CHAT_ID:
+    if chat_id in ADMIN_CHAT_IDS:
         return handle_admin_callback(chat_id, callback_data, message_id)
     else:
-        return handle_user_callback(chat_id, callback_data, message_id)
+        result = handle_user_callback(chat_id, callback_data, message_id)
+        schedule_nudge(chat_id, sessions.get(chat_id))
+        return result
 
 def handle_admin_callback(chat_id, callback_data, message_id):
     if callback_data.startswith("select_order_"):
@@ -371,6 +2019,33 @@ def handle_admin_callback(chat_id, callback_data, message_id):
             # Delete rejected orders
             pass
     
+    elif callback_data.startswith("search_page_"):
+        query = sessions.get(chat_id, {}).get("search_query")
+        if query:
+            page = int(callback_data.replace("search_page_", ""))
+            results_text, keyboard = format_search_results(query, page)
+            edit_message(chat_id, message_id, results_text, keyboard)
+    
+    elif callback_data.startswith("broadcast_target_"):
+        target = callback_data.replace("broadcast_target_", "")
+        edit_message(chat_id, message_id, "📣 <b>متن پیام همگانی را وارد کنید:</b>")
+        sessions[chat_id] = {"step": "waiting_broadcast", "broadcast_status": None if target == "all" else target}
+    
+    elif callback_data == "broadcast_status":
+        keyboard = get_broadcast_progress_keyboard() if broadcast_state.get("state") == "running" else None
+        edit_message(chat_id, message_id, format_broadcast_status(), keyboard)
+    
+    elif callback_data == "broadcast_cancel":
+        broadcast_cancel.set()
+        edit_message(chat_id, message_id, "🚫 <b>درخواست توقف ارسال همگانی ثبت شد.</b>\nگزارش نهایی به زودی ارسال می‌شود.")
+    
+    elif callback_data.startswith("view_order_"):
+        order = lookup_order(callback_data.replace("view_order_", ""))
+        if order:
+            send_message(chat_id, format_admin_order(order, f"📄 <b>جزئیات سفارش</b> | وضعیت: {order.get('status_text', 'در انتظار بررسی')}"))
+        else:
+            send_message(chat_id, "❌ <b>خطا:</b> سفارش یافت نشد!")
+    
     elif callback_data == "no_orders":
         edit_message(chat_id, message_id, "❌ <b>هیچ سفارش فعالی وجود ندارد!</b>", get_admin_menu_keyboard())
     
@@ -385,6 +2060,7 @@ def handle_user_callback(chat_id, callback_data, message_id):
     if callback_data == "cancel_order":
         edit_message(chat_id, message_id, "❌ <b>سفارش لغو شد.</b>\nبرای شروع مجدد /start را ارسال کنید.")
         sessions.pop(chat_id, None)
+        discard_attachments(chat_id)
         return {"ok": True}
     
     if callback_data == "edit_order":
@@ -406,10 +2082,7 @@ def handle_user_callback(chat_id, callback_data, message_id):
         return {"ok": True}
     
     if callback_data == "back_to_confirm":
-        order_id = sess.get("order_id", "ORD-" + uuid.uuid4().hex[:8].upper())
-        sess["order_id"] = order_id
         summary = f"""
-🔖 <b>شناسه سفارش:</b> <code>{order_id}</code>
 👤 <b>نام:</b> {sess.get('name', '')}
 📱 <b>شماره:</b> {sess.get('phone', '')}
 📧 <b>ایمیل:</b> {sess.get('email', 'وارد نشده')}
@@ -464,6 +2137,11 @@ def handle_user_callback(chat_id, callback_data, message_id):
         edit_message(chat_id, message_id, "📝 <b>توضیحات تکمیلی (اختیاری):</b>\n<i>هر چیزی که فکر می‌کنید باید بدانیم یا نقطه برای رد کردن</i>", get_cancel_keyboard())
         sessions[chat_id] = sess
     
+    elif callback_data == "attachments_done":
+        sess["step"] = "support"
+        edit_message(chat_id, message_id, "🛠 <b>آیا مایل به دریافت خدمات پشتیبانی هستید؟</b>", get_yes_no_keyboard("support"))
+        sessions[chat_id] = sess
+    
     elif callback_data.startswith("support_"):
         answer = "بله" if callback_data == "support_yes" else "خیر"
         sess["support"] = answer
@@ -473,10 +2151,7 @@ def handle_user_callback(chat_id, callback_data, message_id):
         if answer == "بله":
             support_message = "\n\n🛠 <b>توجه:</b> دو ماه اول پشتیبانی رایگان است و از ماه سوم به بعد پشتیبانی به عهده شما خواهد بود. قرارداد ما سالیانه است."
         
-        order_id = sess.get("order_id", "ORD-" + uuid.uuid4().hex[:8].upper())
-        sess["order_id"] = order_id
         summary = f"""
-🔖 <b>شناسه سفارش:</b> <code>{order_id}</code>
 👤 <b>نام:</b> {sess.get('name', '')}
 📱 <b>شماره:</b> {sess.get('phone', '')}
 📧 <b>ایمیل:</b> {sess.get('email', 'وارد نشده')}
@@ -492,11 +2167,20 @@ def handle_user_callback(chat_id, callback_data, message_id):
         sessions[chat_id] = sess
     
     elif callback_data == "confirm_yes":
-        # Get user info including username
-        user_info = get_user_info(chat_id)
-        jalali_date = jdatetime.now().strftime("%Y/%m/%d %H:%M:%S")
+        # A redelivered update (e.g. after a router timeout) must not save the order twice
+        if sess.get("step") in ("confirming", "completed"):
+            return {"ok": True}
+        previous_step = sess.get("step")
+        sess["step"] = "confirming"
+        sessions[chat_id] = sess
+        try:
+            # Get user info including username
+            user_info = get_user_info(chat_id)
+            # Issued at save time so the ID's timestamp matches the order's date
+            sess["order_id"] = new_order_id()
+            jalali_date = jdatetime.now().strftime("%Y/%m/%d %H:%M:%S")
         
-        order_text = f"""
+            order_text = f"""
 OrderID: {sess.get('order_id', '')}
 Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 Jalali Date: {jalali_date}
@@ -514,52 +2198,41 @@ Chat ID: {chat_id}
 Status: pending
         """
         
-        order_data = {
-            'order_id': sess.get('order_id', ''),
-            'date': datetime.now().isoformat(),
-            'jalali_date': jalali_date,
-            'name': sess.get('name', ''),
-            'phone': sess.get('phone', ''),
-            'email': sess.get('email', ''),
-            'telegram_username': user_info['username'],
-            'business': sess.get('business', ''),
-            'purpose': sess.get('purpose', ''),
-            'features': sess.get('features', ''),
-            'domain': sess.get('domain', ''),
-            'extra': sess.get('extra', ''),
-            'support': sess.get('support', ''),
-            'chat_id': chat_id,
-            'status': 'pending',
-            'status_text': 'در انتظار بررسی'
-        }
-        
-        save_order(order_text, order_data)
+            order_data = {
+                'order_id': sess.get('order_id', ''),
+                'date': datetime.now().isoformat(),
+                'jalali_date': jalali_date,
+                'name': sess.get('name', ''),
+                'phone': sess.get('phone', ''),
+                'email': sess.get('email', ''),
+                'telegram_username': user_info['username'],
+                'business': sess.get('business', ''),
+                'purpose': sess.get('purpose', ''),
+                'features': sess.get('features', ''),
+                'domain': sess.get('domain', ''),
+                'extra': sess.get('extra', ''),
+                'support': sess.get('support', ''),
+                'attachments': [],
+                'chat_id': chat_id,
+                'status': 'pending',
+                'status_text': 'در انتظار بررسی'
+            }
         
-        # زیباتر کردن پیام ادمین
-        admin_text = f"""
-🆕 <b>سفارش جدید دریافت شد!</b>
-
-🔖 <b>شناسه:</b> <code>{sess.get('order_id', '')}</code>
-📅 <b>تاریخ:</b> {jalali_date}
-
-👤 <b>اطلاعات مشتری:</b>
-├ نام: {sess.get('name', '')}
-├ تلگرام: {user_info['username']}
-├ شماره: {sess.get('phone', '')}
-└ ایمیل: {sess.get('email', 'ندارد')}
-
-💼 <b>جزئیات پروژه:</b>
-├ کسب‌وکار: {sess.get('business', '')}
-├ هدف: {sess.get('purpose', '')}
-├ ویژگی‌ها: {sess.get('features', '')}
-├ دامنه/هاست: {sess.get('domain', '')}
-├ پشتیبانی: {sess.get('support', '')}
-└ توضیحات: {sess.get('extra', 'ندارد')}
-
-🔗 <b>Chat ID:</b> <code>{chat_id}</code>
-        """
+            save_order(order_text, order_data)
+        except Exception:
+            # Nothing was saved, so a redelivered confirm may try again
+            sess["step"] = previous_step
+            raise
+        sess["step"] = "completed"
+        attachment_downloads = attachment_jobs.pop(chat_id, [])
+        cancel_timer(f"attachments:{chat_id}")
         
-        send_message(ADMIN_CHAT_ID, admin_text)
+        try:
+            notify_new_order(order_data)
+        except requests.RequestException:
+            # The order is saved; the customer still gets the confirmation below
+            app.logger.exception("Could not notify admins of order %s", order_data['order_id'])
+        attach_when_done(order_data['order_id'], attachment_downloads)
         
         edit_message(chat_id, message_id, f"""
 ✅ <b>سفارش شما با موفقیت ثبت شد!</b>
@@ -572,13 +2245,11 @@ Status: pending
 
 💡 <b>نکته:</b> با استفاده از دکمه "🔍 پیگیری سفارش" می‌توانید وضعیت سفارش خود را پیگیری کنید.
         """)
-        
-        sess["step"] = "completed"
-        sessions[chat_id] = sess
     
     elif callback_data == "confirm_no":
         edit_message(chat_id, message_id, "❌ <b>سفارش لغو شد.</b>\nبرای شروع مجدد /start را ارسال کنید.")
         sessions.pop(chat_id, None)
+        discard_attachments(chat_id)
     
     return {"ok": True}
 
@@ -607,10 +2278,18 @@ def handle_admin_message(chat_id, text):
 ├ 💰 قیمت اعلام شده: {stats['priced']}
 ├ ✅ تکمیل شده: {stats['completed']}
 └ ❌ رد شده: {stats['rejected']}
-        """
+        """ + format_missing_shards(stats['missing_shards'])
         send_message(chat_id, stats_text, get_admin_menu_keyboard())
         return {"ok": True}
     
+    elif text == "📈 تحلیل سفارشات" or text == "/analytics":
+        send_message(chat_id, format_analytics(), get_admin_menu_keyboard())
+        return {"ok": True}
+    
+    elif text == "/analytics rebuild":
+        send_message(chat_id, "✅ <b>تحلیل سفارشات از نو محاسبه شد!</b>\n\n" + format_analytics(rebuild=True), get_admin_menu_keyboard())
+        return {"ok": True}
+    
     elif text == "💰 اعلام قیمت":
         send_message(chat_id, "<b>💰 انتخاب سفارش برای اعلام قیمت:</b>", get_orders_selection_keyboard())
         sessions[chat_id] = {"admin_action": "price"}
@@ -625,6 +2304,36 @@ def handle_admin_message(chat_id, text):
         send_message(chat_id, "<b>🗑 انتخاب نوع حذف:</b>", get_delete_options_keyboard())
         return {"ok": True}
     
+    elif text == "📤 خروجی سفارشات" or text.startswith("/export"):
+        try:
+            fmt, start, end, status = parse_export_command(text)
+        except ValueError:
+            send_message(chat_id, "❌ <b>خطا:</b> تاریخ نامعتبر است!\n<i>(مثال: /export csv 1403/01/01 1403/02/01 pending)</i>", get_admin_menu_keyboard())
+            return {"ok": True}
+        try:
+            path = export_to_file(fmt, start, end, status)
+        except requests.RequestException:
+            app.logger.exception("Export failed")
+            send_message(chat_id, "❌ <b>خطا:</b> یکی از سرورها در دسترس نیست، لطفاً دوباره تلاش کنید.", get_admin_menu_keyboard())
+            return {"ok": True}
+        try:
+            send_document(chat_id, path, f"orders.{fmt}", "📤 <b>خروجی سفارشات</b>\n<i>فیلتر: /export [csv|jsonl] [از تاریخ] [تا تاریخ] [وضعیت]</i>")
+        finally:
+            os.remove(path)
+        return {"ok": True}
+    
+    elif text == "📣 ارسال همگانی":
+        if broadcast_state.get("state") == "running":
+            send_message(chat_id, format_broadcast_status(), get_broadcast_progress_keyboard())
+        else:
+            send_message(chat_id, "<b>📣 انتخاب گیرندگان پیام همگانی:</b>", get_broadcast_target_keyboard())
+        return {"ok": True}
+    
+    elif text == "🔎 جستجوی سفارش":
+        send_message(chat_id, "🔎 <b>عبارت جستجو را وارد کنید:</b>\n<i>(نام، شماره، نوع کسب‌وکار، هدف، ویژگی‌ها یا توضیحات)\nبرای محدود کردن تاریخ: از:1403/05/01</i>", get_admin_menu_keyboard())
+        sessions[chat_id] = {"step": "waiting_search"}
+        return {"ok": True}
+    
     # Handle price input
     if admin_sess.get("step") == "waiting_price":
         try:
@@ -634,16 +2343,10 @@ def handle_admin_message(chat_id, text):
             # Find target customer
             target_chat_id = None
             target_name = None
-            try:
-                with open(ORDERS_JSON, "r", encoding="utf-8") as f:
-                    orders = json.load(f)
-                for order in orders:
-                    if order['order_id'] == order_id:
-                        target_chat_id = order['chat_id']
-                        target_name = order['name']
-                        break
-            except (FileNotFoundError, json.JSONDecodeError):
-                pass
+            order = lookup_order(order_id)
+            if order:
+                target_chat_id = order['chat_id']
+                target_name = order['name']
             
             if target_chat_id:
                 customer_message = f"""
@@ -658,7 +2361,7 @@ def handle_admin_message(chat_id, text):
                 send_message(target_chat_id, customer_message)
                 
                 # Update order status
-                update_order_status(order_id, "priced", f"قیمت اعلام شده: {price:,} تومان")
+                set_order_status(order_id, "priced", f"قیمت اعلام شده: {price:,} تومان", price)
                 
                 send_message(chat_id, f"✅ <b>قیمت با موفقیت اعلام شد!</b>\n\n💰 مبلغ: <b>{price:,} تومان</b>\n🔖 سفارش: <code>{order_id}</code>", get_admin_menu_keyboard())
             else:
@@ -676,16 +2379,10 @@ def handle_admin_message(chat_id, text):
         # Find target customer
         target_chat_id = None
         target_name = None
-        try:
-            with open(ORDERS_JSON, "r", encoding="utf-8") as f:
-                orders = json.load(f)
-            for order in orders:
-                if order['order_id'] == order_id:
-                    target_chat_id = order['chat_id']
-                    target_name = order['name']
-                    break
-        except (FileNotFoundError, json.JSONDecodeError):
-            pass
+        order = lookup_order(order_id)
+        if order:
+            target_chat_id = order['chat_id']
+            target_name = order['name']
         
         if target_chat_id:
             customer_message = f"""
@@ -700,7 +2397,7 @@ def handle_admin_message(chat_id, text):
             send_message(target_chat_id, customer_message)
             
             # Update order status
-            update_order_status(order_id, "rejected", f"رد شده: {reason}")
+            set_order_status(order_id, "rejected", f"رد شده: {reason}")
             
             send_message(chat_id, f"✅ <b>سفارش با موفقیت رد شد!</b>\n\n🔖 سفارش: <code>{order_id}</code>\n📝 دلیل: {reason}", get_admin_menu_keyboard())
         else:
@@ -708,11 +2405,30 @@ def handle_admin_message(chat_id, text):
         
         sessions.pop(chat_id, None)
     
+    # Handle broadcast text
+    elif admin_sess.get("step") == "waiting_broadcast":
+        if not text.strip():
+            send_message(chat_id, "❌ <b>متن پیام خالی است!</b>\nلطفاً متن پیام همگانی را به صورت متنی ارسال کنید.")
+            return {"ok": True}
+        if start_broadcast(chat_id, html.escape(text.strip()), admin_sess.get("broadcast_status")):
+            send_message(chat_id, f"📣 <b>ارسال همگانی آغاز شد!</b>\n👥 تعداد گیرندگان: {len(broadcast_state['recipients'])}", get_broadcast_progress_keyboard())
+        else:
+            send_message(chat_id, "❌ <b>خطا:</b> یک ارسال همگانی در حال انجام است!", get_broadcast_progress_keyboard())
+        sessions.pop(chat_id, None)
+    
+    # Handle search query
+    elif admin_sess.get("step") == "waiting_search":
+        query = text.strip()
+        results_text, keyboard = format_search_results(query)
+        send_message(chat_id, results_text, keyboard)
+        sessions[chat_id] = {"search_query": query}
+    
     return {"ok": True}
 
 def handle_user_message(chat_id, text, message):
     if text == "/start" or text == "🏠 شروع مجدد":
         sessions[chat_id] = {"step": "name", "chat_id": chat_id}
+        discard_attachments(chat_id)
         welcome_msg = """
 🌟 <b>سلام! به سیستم سفارش وب‌سایت خوش آمدید</b> 🌟
 
@@ -724,13 +2440,14 @@ def handle_user_message(chat_id, text, message):
         return {"ok": True}
     
     elif text == "🔍 پیگیری سفارش":
-        send_message(chat_id, "🔍 <b>لطفاً شناسه سفارش خود را وارد کنید:</b>\n<i>(مثال: ORD-A1B2C3D4)</i>", get_menu_keyboard())
+        send_message(chat_id, "🔍 <b>لطفاً شناسه سفارش خود را وارد کنید:</b>\n<i>(مثال: ORD-0K3ZV8Q2A)</i>", get_menu_keyboard())
         sessions[chat_id] = {"step": "track_order"}
         return {"ok": True}
     
     elif text == "🚫 لغو سفارش":
         send_message(chat_id, "❌ <b>سفارش لغو شد.</b>\nبرای شروع مجدد 'شروع مجدد' را انتخاب کنید.", get_menu_keyboard())
         sessions.pop(chat_id, None)
+        discard_attachments(chat_id)
         return {"ok": True}
     
     sess = sessions.get(chat_id)
@@ -742,27 +2459,21 @@ def handle_user_message(chat_id, text, message):
     
     # Handle order tracking
     if step == "track_order":
-        order_id = text.strip().upper()
-        try:
-            with open(ORDERS_JSON, "r", encoding="utf-8") as f:
-                orders = json.load(f)
-            
+        order_id = normalize_order_id(text)
+        found_order = find_order(order_id)
+        if found_order and found_order['chat_id'] != chat_id:
             found_order = None
-            for order in orders:
-                if order['order_id'] == order_id and order['chat_id'] == chat_id:
-                    found_order = order
-                    break
+        
+        if found_order:
+            status_emoji = {
+                "pending": "⏳",
+                "priced": "💰", 
+                "completed": "✅",
+                "rejected": "❌"
+            }
+            emoji = status_emoji.get(found_order.get("status", "pending"), "⏳")
             
-            if found_order:
-                status_emoji = {
-                    "pending": "⏳",
-                    "priced": "💰", 
-                    "completed": "✅",
-                    "rejected": "❌"
-                }
-                emoji = status_emoji.get(found_order.get("status", "pending"), "⏳")
-                
-                track_text = f"""
+            track_text = f"""
 🔍 <b>وضعیت سفارش شما:</b>
 
 🔖 <b>شناسه:</b> <code>{found_order['order_id']}</code>
@@ -772,12 +2483,10 @@ def handle_user_message(chat_id, text, message):
 👤 <b>نام:</b> {found_order['name']}
 💼 <b>کسب‌وکار:</b> {found_order['business']}
 🎯 <b>هدف:</b> {found_order['purpose']}
-                """
-                send_message(chat_id, track_text, get_menu_keyboard())
-            else:
-                send_message(chat_id, "❌ <b>سفارش یافت نشد!</b>\nلطفاً شناسه سفارش را بررسی کنید یا با پشتیبانی تماس بگیرید.", get_menu_keyboard())
-        except (FileNotFoundError, json.JSONDecodeError):
-            send_message(chat_id, "❌ <b>خطا در دسترسی به اطلاعات!</b>\nلطفاً دوباره تلاش کنید.", get_menu_keyboard())
+            """
+            send_message(chat_id, track_text, get_menu_keyboard())
+        else:
+            send_message(chat_id, "❌ <b>سفارش یافت نشد!</b>\nلطفاً شناسه سفارش را بررسی کنید یا با پشتیبانی تماس بگیرید.", get_menu_keyboard())
         
         sessions.pop(chat_id, None)
         return {"ok": True}
@@ -815,10 +2524,7 @@ def handle_user_message(chat_id, text, message):
         send_message(chat_id, f"✅ <b>{field_names[field]} با موفقیت به‌روزرسانی شد!</b>\n\n🔙 بازگشت به صفحه تأیید...", get_cancel_keyboard())
         
         # Return to confirmation
-        order_id = sess.get("order_id", "ORD-" + uuid.uuid4().hex[:8].upper())
-        sess["order_id"] = order_id
         summary = f"""
-🔖 <b>شناسه سفارش:</b> <code>{order_id}</code>
 👤 <b>نام:</b> {sess.get('name', '')}
 📱 <b>شماره:</b> {sess.get('phone', '')}
 📧 <b>ایمیل:</b> {sess.get('email', 'وارد نشده')}
@@ -878,12 +2584,198 @@ def handle_user_message(chat_id, text, message):
     
     elif step == "extra":
         sess["extra"] = text.strip()
-        sess["step"] = "support"
-        send_message(chat_id, "🛠 <b>آیا مایل به دریافت خدمات پشتیبانی هستید؟</b>", get_yes_no_keyboard("support"))
+        sess["step"] = "attachments"
+        send_message(chat_id, f"📎 <b>فایل یا تصویر نمونه، لوگو یا مستندات خود را ارسال کنید:</b>\n<i>(اختیاری - حداکثر {MAX_ATTACHMENTS_PER_ORDER} فایل، هر کدام تا {MAX_ATTACHMENT_BYTES // (1024 * 1024)} مگابایت)</i>", get_attachments_keyboard())
+    
+    elif step == "attachments":
+        attachment = get_attachment_info(message)
+        if not attachment:
+            send_message(chat_id, "📎 <b>لطفاً فایل یا تصویر ارسال کنید یا دکمه ادامه را بزنید.</b>", get_attachments_keyboard())
+            return {"ok": True}
+        file_id, file_name, file_size = attachment
+        count = sess.get("attachment_count", 0)
+        if count >= MAX_ATTACHMENTS_PER_ORDER:
+            send_message(chat_id, f"❌ <b>حداکثر {MAX_ATTACHMENTS_PER_ORDER} فایل قابل ارسال است!</b>", get_attachments_keyboard())
+            return {"ok": True}
+        if file_size > MAX_ATTACHMENT_BYTES:
+            send_message(chat_id, f"❌ <b>حجم فایل بیش از {MAX_ATTACHMENT_BYTES // (1024 * 1024)} مگابایت است!</b>", get_attachments_keyboard())
+            return {"ok": True}
+        # Bounds disk use per customer across restarted orders, not just per order
+        if not take_token(f"attach:{chat_id}", MAX_ATTACHMENTS_PER_DAY / 86400, MAX_ATTACHMENTS_PER_DAY):
+            send_message(chat_id, f"❌ <b>سقف ارسال فایل امروز ({MAX_ATTACHMENTS_PER_DAY} فایل) پر شده است!</b>\nلطفاً دکمه ادامه را بزنید.", get_attachments_keyboard())
+            return {"ok": True}
+        queue_attachment(chat_id, file_id, file_name)
+        sess["attachment_count"] = count + 1
+        send_message(chat_id, f"✅ <b>فایل دریافت شد ({count + 1} از {MAX_ATTACHMENTS_PER_ORDER}).</b>\nفایل دیگری بفرستید یا دکمه ادامه را بزنید.", get_attachments_keyboard())
     
     sessions[chat_id] = sess
     return {"ok": True}
 
+@app.route("/export", methods=["GET"])
+def export_route():
+    if not check_admin_key():
+        return {"ok": False, "error": "unauthorized"}, 401
+    fmt = request.args.get("format", "csv")
+    status = request.args.get("status")
+    if fmt not in ("csv", "jsonl") or (status and status not in ORDER_STATUSES):
+        return {"ok": False, "error": "invalid format or status"}, 400
+    try:
+        start = parse_date_filter(request.args.get("from"))
+        end = parse_date_filter(request.args.get("to"), end=True)
+    except ValueError:
+        return {"ok": False, "error": "invalid date"}, 400
+    chunks = export_orders(fmt, start, end, status)
+    try:
+        # Pull the first chunk up front so an unreachable shard fails the request instead of truncating it
+        first = next(chunks, "")
+    except requests.RequestException:
+        app.logger.exception("Export failed")
+        return {"ok": False, "error": "shard unavailable"}, 503
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(
+        stream_with_context(itertools.chain([first], chunks)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=orders.{fmt}"}
+    )
+
+@app.route("/import", methods=["POST"])
+def import_route():
+    if not check_admin_key():
+        return {"ok": False, "error": "unauthorized"}, 401
+    fmt = request.args.get("format", "jsonl")
+    if fmt not in ("csv", "jsonl"):
+        return {"ok": False, "error": "invalid format"}, 400
+    lines = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    try:
+        result = import_orders(lines, fmt) if SHARD_COUNT == 1 else import_sharded(lines, fmt)
+    except requests.RequestException:
+        app.logger.exception("Import failed")
+        return {"ok": False, "error": "shard unavailable"}, 503
+    except (ValueError, KeyError, AttributeError):
+        return {"ok": False, "error": "invalid input"}, 400
+    return {"ok": True, **result}
+
+@app.route("/analytics", methods=["GET", "POST"])
+def analytics_route():
+    if not check_admin_key():
+        return {"ok": False, "error": "unauthorized"}, 401
+    rebuild = request.method == "POST" or bool(request.args.get("rebuild"))
+    return {"ok": True, "analytics": get_analytics(rebuild)}
+
+@app.route("/metrics", methods=["GET"])
+def metrics_route():
+    if not check_admin_key():
+        return {"ok": False, "error": "unauthorized"}, 401
+    if SHARD_COUNT == 1:
+        return {"ok": True, "scheduler": get_scheduler_metrics()}
+    return {"ok": True, "scheduler": get_scheduler_metrics(), "shards": scatter("metrics")}
+
+def check_shard_key():
+    key = request.headers.get("X-Shard-Key", "")
+    return bool(SHARD_SECRET) and hmac.compare_digest(key.encode("utf-8"), SHARD_SECRET.encode("utf-8"))
+
+@app.route("/internal/orders", methods=["POST"])
+def internal_orders_route():
+    """This shard's filtered orders as JSONL, streamed to the shard running an export"""
+    if not check_shard_key():
+        return {"ok": False, "error": "unauthorized"}, 401
+    filters = request.get_json() or {}
+    orders = local_filter_orders(filters.get("start"), filters.get("end"), filters.get("status"))
+    return Response(
+        stream_with_context(json.dumps(order, ensure_ascii=False) + "\n" for order in orders),
+        mimetype="application/x-ndjson"
+    )
+
+@app.route("/internal/import", methods=["POST"])
+def internal_import_route():
+    if not check_shard_key():
+        return {"ok": False, "error": "unauthorized"}, 401
+    lines = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    try:
+        return {"ok": True, "result": import_orders(lines)}
+    except (ValueError, KeyError, AttributeError):
+        return {"ok": False, "error": "invalid input"}, 400
+
+@app.route("/internal/<op>", methods=["POST"])
+def internal_route(op):
+    if not check_shard_key():
+        return {"ok": False, "error": "unauthorized"}, 401
+    try:
+        return {"ok": True, "result": run_internal_op(op, request.get_json() or {})}
+    except (ValueError, KeyError):
+        return {"ok": False, "error": "invalid request"}, 400
+
+router_app = Flask("router")
+
+@router_app.route("/", methods=["POST"])
+def route_update():
+    """Front router: forward each Telegram update to the shard owning its chat"""
+    chat_id = update_chat_id(request.get_json() or {})
+    shard = shard_for_chat(chat_id) if chat_id else 0
+    try:
+        response = requests.post(
+            shard_url(shard) + "/",
+            data=request.get_data(),
+            headers={"Content-Type": "application/json"},
+            timeout=SHARD_TIMEOUT
+        )
+    except requests.Timeout:
+        # The shard has the update and is still handling it; a retry from Telegram would run it twice
+        router_app.logger.warning("Shard %s timed out on an update for chat %s", shard, chat_id)
+        return {"ok": True}
+    except requests.RequestException:
+        # Nothing reached the shard, so let Telegram redeliver once it is back
+        router_app.logger.exception("Shard %s is unreachable", shard)
+        return {"ok": False, "error": "shard unavailable"}, 503
+    return Response(response.content, status=response.status_code, mimetype="application/json")
+
+@router_app.route("/<any(export, import, analytics, metrics):path>", methods=["GET", "POST"])
+def route_admin(path):
+    """Proxy the admin API to shard 0, which gathers results from every shard"""
+    headers = {name: value for name, value in request.headers.items() if name in ("X-Admin-Key", "Content-Type")}
+    try:
+        response = requests.request(
+            request.method,
+            f"{shard_url(0)}/{path}",
+            params=request.args,
+            data=request.stream if request.method == "POST" else None,
+            headers=headers,
+            stream=True,
+            timeout=SHARD_TIMEOUT
+        )
+    except requests.RequestException:
+        router_app.logger.exception("Shard 0 is unreachable")
+        return {"ok": False, "error": "shard unavailable"}, 503
+    passthrough = {name: value for name, value in response.headers.items() if name in ("Content-Type", "Content-Disposition")}
+    proxied = Response(response.iter_content(EXPORT_CHUNK_SIZE), status=response.status_code, headers=passthrough)
+    proxied.call_on_close(response.close)
+    return proxied
+
+def run_cluster(port):
+    """Start SHARD_COUNT shard processes on localhost and serve the router on `port`"""
+    env = dict(os.environ, SHARD_SECRET=SHARD_SECRET or secrets.token_hex(16))
+    shards = []
+    for shard in range(SHARD_COUNT):
+        shard_env = dict(env, SHARD_INDEX=str(shard), PORT=str(SHARD_BASE_PORT + shard))
+        shards.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=shard_env))
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        router_app.run(host="0.0.0.0", port=port)
+    finally:
+        for process in shards:
+            process.terminate()
+        for process in shards:
+            process.wait()
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port)
+    if sys.argv[1:] == ["cluster"]:
+        run_cluster(port)
+    elif sys.argv[1:2] == ["migrate"]:
+        sys.exit(0 if migrate_orders(*sys.argv[2:4]) else 1)
+    elif SHARD_COUNT > 1:
+        start_scheduler()
+        app.run(host="127.0.0.1", port=port)
+    else:
+        start_scheduler()
+        app.run(host="0.0.0.0", port=port)
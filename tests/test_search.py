@@ -0,0 +1,114 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import main
+
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        main.search_index.clear()
+        main.search_tokens.clear()
+        main.search_docs.clear()
+        main.search_time_ids.clear()
+        main.search_legacy_ids.clear()
+        main.search_loaded = False
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def order(self, order_id, date="2025-01-01T10:00:00", **fields):
+        return {"order_id": order_id, "date": date, "status": "pending", "status_text": "در انتظار بررسی", **fields}
+
+
+class NormalizeTest(SearchTestCase):
+    def test_arabic_letters_become_persian(self):
+        self.assertEqual(main.normalize_persian("علي كريمي"), "علی کریمی")
+
+    def test_digits_are_ascii(self):
+        self.assertEqual(main.normalize_persian("۰۹۱۲٣٤٥"), "0912345")
+
+    def test_zwnj_splits_words(self):
+        self.assertEqual(main.tokenize("فروشگاه‌ها"), ["فروشگاه", "ها"])
+
+
+class RankTest(SearchTestCase):
+    def test_exact_match_ranks_above_partial(self):
+        main.write_orders([
+            self.order("ORD-A", name="علیرضا", date="2025-02-01T00:00:00"),
+            self.order("ORD-B", name="علی", date="2025-01-01T00:00:00"),
+        ])
+        self.assertEqual([o["order_id"] for o in main.search_orders("علي")], ["ORD-B", "ORD-A"])
+
+    def test_ties_are_newest_first(self):
+        main.write_orders([
+            self.order("ORD-A", business="گالری", date="2025-01-01T00:00:00"),
+            self.order("ORD-B", business="گالری", date="2025-03-01T00:00:00"),
+        ])
+        self.assertEqual([o["order_id"] for o in main.search_orders("گالری")], ["ORD-B", "ORD-A"])
+
+    def test_every_term_must_match(self):
+        main.write_orders([
+            self.order("ORD-A", name="مریم", business="فروشگاه"),
+            self.order("ORD-B", name="مریم", business="شرکت"),
+        ])
+        self.assertEqual([o["order_id"] for o in main.search_orders("مریم فروشگاه")], ["ORD-A"])
+
+    def test_partial_phone(self):
+        main.write_orders([self.order("ORD-A", phone="09123456789")])
+        self.assertEqual(len(main.search_orders("۳۴۵۶")), 1)
+
+    def test_since_filter(self):
+        old = main.encode_order_id(0)
+        new = main.new_order_id()
+        main.write_orders([
+            self.order(old, name="سارا", date="2024-01-01T00:00:00"),
+            self.order(new, name="سارا", date="2026-01-01T00:00:00"),
+        ])
+        self.assertEqual([o["order_id"] for o in main.search_orders("سارا since:2025-01-01")], [new])
+
+    def test_writes_update_the_index(self):
+        main.write_orders([self.order("ORD-A", name="رضا")])
+        main.load_search_index()
+        main.save_order("", self.order("ORD-B", name="رضا"))
+        self.assertEqual(len(main.search_orders("رضا")), 2)
+        main.update_order_status("ORD-A", "rejected", "رد شده")
+        self.assertEqual(main.search_docs["ORD-A"]["status"], "rejected")
+        main.delete_order("ORD-B")
+        self.assertEqual([o["order_id"] for o in main.search_orders("رضا")], ["ORD-A"])
+
+
+class FormatTest(SearchTestCase):
+    def test_pagination(self):
+        main.write_orders([self.order(f"ORD-{i:02d}", name="نیما", date=f"2025-01-{i + 1:02d}T00:00:00") for i in range(12)])
+        text, keyboard = main.format_search_results("نیما")
+        self.assertIn("صفحه 1 از 3", text)
+        self.assertIn("ORD-11", text)
+        self.assertNotIn("ORD-06", text)
+        self.assertIn("search_page_1", str(keyboard))
+        self.assertNotIn("search_page_-1", str(keyboard))
+        text, keyboard = main.format_search_results("نیما", page=9)
+        self.assertIn("صفحه 3 از 3", text)
+        self.assertIn("ORD-00", text)
+        self.assertIn("search_page_1", str(keyboard))
+
+    def test_fields_are_html_escaped(self):
+        main.write_orders([self.order("ORD-A", name="<3 نیما", business="a&b")])
+        text, _ = main.format_search_results("<b>نیما")
+        self.assertIn("&lt;3 نیما", text)
+        self.assertIn("a&amp;b", text)
+        self.assertIn("&lt;b&gt;نیما", text)
+
+    def test_no_results(self):
+        text, keyboard = main.format_search_results("ناموجود")
+        self.assertIsNone(keyboard)
+
+
+if __name__ == "__main__":
+    unittest.main()